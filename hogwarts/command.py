@@ -305,6 +305,141 @@ def ls():
     print('house:    {}'.format(find_house('', True).parent), flush=True)
 
 
+def pack():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('imglist')
+    parser.add_argument('root')
+    parser.add_argument('out_dir')
+    parser.add_argument('--items-per-shard', '-n', type=int, default=10000)
+    parser.add_argument('--num-workers', '-j', type=int, default=None)
+    opt = parser.parse_args()
+
+    from .data.readers import pack_shards
+    start = time.time()
+    num_items, num_shards = pack_shards(opt.imglist, opt.root, opt.out_dir,
+                                        opt.items_per_shard, opt.num_workers)
+    success('packed {} images into {} shards at {}'.format(num_items, num_shards, opt.out_dir),
+            'took {:.1f}s'.format(time.time() - start))
+
+
+def build_reader(name, path, root):
+    from .data import readers
+    if name == 'direct':
+        return readers.DirectReader()
+    if name == 'ceph':
+        from .data.readers.ceph_reader import CephReader
+        return CephReader()
+    if path is None:
+        fail('--reader-path is required for reader {}'.format(name))
+    if name == 'lmdb':
+        return readers.LMDBReader(path)
+    if name == 'shard':
+        # shard names are relative to the imglist root the paths are joined with
+        return readers.ShardReader(path, root=root)
+    fail('unexpected reader: {} (direct/lmdb/shard/ceph expected)'.format(name))
+
+
+def scan():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('imglist')
+    parser.add_argument('root')
+    parser.add_argument('out')
+    parser.add_argument('--reader', default='direct', choices=['direct', 'lmdb', 'shard', 'ceph'])
+    parser.add_argument('--reader-path', default=None)
+    parser.add_argument('--num-workers', '-j', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--report-interval', type=float, default=10)
+    parser.add_argument('--blacklist', default=None,
+                        help='also append broken indices to this dataset blacklist file')
+    opt = parser.parse_args()
+
+    from .data import scan as scan_lib
+    reader = build_reader(opt.reader, opt.reader_path, opt.root)
+    records, num_scanned, elapsed = scan_lib.scan_imglist(
+        opt.imglist, opt.root, reader, opt.out, opt.num_workers, opt.chunk_size, opt.report_interval)
+
+    broken = (records['status'] != scan_lib.SCAN_OK).nonzero()[0]
+    if opt.blacklist is not None:
+        from .data.datasets import Blacklist
+        from .data.datasets.imglist import _cache_key
+        # the same source the datasets check, so they accept it
+        blacklist = Blacklist(opt.blacklist, source='{}:{}'.format(_cache_key(opt.imglist, None), opt.root))
+        for index in broken:
+            blacklist.add(int(index))
+    success('scanned {} images in {:.1f}s ({:.1f} img/s)'.format(
+                num_scanned, elapsed, num_scanned / max(elapsed, 1e-9)),
+            '{} of {} images broken'.format(len(broken), len(records)),
+            'wrote {}'.format(opt.out))
+
+
+def bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('imglist')
+    parser.add_argument('root')
+    parser.add_argument('--reader', action='append', default=None,
+                        help='reader to compare, as name or name:path (direct/lmdb/shard/ceph), repeatable')
+    parser.add_argument('--num-workers', '-j', type=int, nargs='+', default=[0, 2, 4, 8])
+    parser.add_argument('--batch-size', '-b', type=int, default=64)
+    parser.add_argument('--num-samples', '-n', type=int, default=2048)
+    parser.add_argument('--size', type=int, default=224, help='resize side of the built-in transform')
+    parser.add_argument('--decode-max-size', type=int, default=None)
+    parser.add_argument('--multi-label', type=int, default=None, metavar='NUM_CLASSES')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', '-o', default=None, help='write results as json')
+    opt = parser.parse_args()
+
+    import json
+    import numpy as np
+    from .data import bench as bench_lib
+    from .data.datasets import SingleLabelDataset, MultiLabelDataset, MultiLabelCollate
+
+    transform = bench_lib.ToTensor(opt.size)
+    if opt.multi_label is None:
+        dataset = SingleLabelDataset(opt.imglist, opt.root, None, transform,
+                                     decode_max_size=opt.decode_max_size, skip_broken=False, profile=True)
+        collate_fn = None
+    else:
+        dataset = MultiLabelDataset(opt.imglist, opt.root, None, transform, opt.multi_label,
+                                    decode_max_size=opt.decode_max_size, label_format='indices',
+                                    skip_broken=False, profile=True)
+        collate_fn = MultiLabelCollate(opt.multi_label)
+    num_samples = min(opt.num_samples, len(dataset))
+    indices = np.random.RandomState(opt.seed).permutation(len(dataset))[:num_samples].tolist()
+
+    results = {'config': vars(opt), 'runs': []}
+    for spec in opt.reader or ['direct']:
+        name, _, path = spec.partition(':')
+        dataset.reader = build_reader(name, path or None, opt.root)
+        stages, batch, broken = bench_lib.bench_stages(dataset, indices, opt.batch_size, collate_fn)
+        # the loader runs do not skip broken samples, so leave them out there too
+        broken_set = set(broken)
+        loader_indices = [index for index in indices if index not in broken_set]
+        if batch is not None:
+            stages['ipc'] = bench_lib.bench_ipc(batch, opt.batch_size, max(num_samples // opt.batch_size, 1))
+        loader = {}
+        for num_workers in opt.num_workers:
+            loader[num_workers] = bench_lib.bench_loader(dataset, loader_indices, opt.batch_size, num_workers,
+                                                         collate_fn)
+        results['runs'].append({'reader': spec, 'stages': stages, 'broken': len(broken), 'loader': loader})
+
+        print('reader {}, {} of {} samples broken'.format(spec, len(broken), num_samples), flush=True)
+        for stage, summary in stages.items():
+            print('\t{:<10} {:>10.1f} samples/s  p50 {:8.2f}ms  p90 {:8.2f}ms  p99 {:8.2f}ms'.format(
+                stage, summary['samples_per_sec'], summary['p50_ms'], summary['p90_ms'], summary['p99_ms']),
+                flush=True)
+        for num_workers, summary in loader.items():
+            print('\tworkers={:<3} {:>10.1f} samples/s  batch p50 {:8.2f}ms  p99 {:8.2f}ms'.format(
+                num_workers, summary['samples_per_sec'], summary['p50_ms'], summary['p99_ms']), flush=True)
+            print('\t            in workers: {}'.format(', '.join(
+                '{} {:.2f}ms'.format(stage, stats['mean']) for stage, stats in summary['stages'].items())),
+                flush=True)
+
+    if opt.output is not None:
+        with open(opt.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        success('wrote {}'.format(opt.output))
+
+
 # =========================================================
 # Test
 # =========================================================
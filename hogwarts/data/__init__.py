@@ -1,3 +1,5 @@
 from . import datasets
 from . import samplers
 from . import readers
+from . import scan
+from . import bench
@@ -0,0 +1,144 @@
+__all__ = ['STAGES', 'ToTensor', 'summarize', 'bench_stages', 'bench_ipc', 'bench_loader']
+
+
+import time
+import logging
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+from torch.utils.data.dataloader import default_collate
+from PIL import Image
+from ..record import RecordManager
+from .datasets.base_dataset import open_buffer, record_timing
+
+
+STAGES = ('read', 'decode', 'convert', 'transform', 'collate', 'ipc')
+
+
+class ToTensor:
+    # a torchvision-free stand-in for the usual resize + to-tensor transform
+
+    def __init__(self, size=None):
+        self.size = size
+
+    def __call__(self, image):
+        if self.size is not None:
+            image = image.resize((self.size, self.size), Image.BILINEAR)
+        array = np.array(image)
+        if array.ndim == 2:
+            array = array[:, :, None]
+        return torch.from_numpy(array).permute(2, 0, 1).float().div_(255)
+
+
+def summarize(latencies, num_samples):
+    # latencies are in seconds, one per sample or one per batch
+    latencies = np.asarray(latencies, dtype=np.float64)
+    total = latencies.sum()
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    return {
+        'samples_per_sec': num_samples / total if total > 0 else float('inf'),
+        'mean_ms': latencies.mean() * 1e3,
+        'p50_ms': p50,
+        'p90_ms': p90,
+        'p99_ms': p99,
+        'max_ms': latencies.max() * 1e3,
+    }
+
+
+def bench_stages(dataset, indices, batch_size, collate_fn=None):
+    # runs the steps of SingleLabelDataset.load_image one by one in this
+    # process, so each is timed without the others in the way; broken
+    # samples are logged and left out, and their indices returned
+    collate_fn = default_collate if collate_fn is None else collate_fn
+    latencies = {stage: [] for stage in STAGES[:4]}
+    samples = []
+    broken = []
+    for index in indices:
+        path = dataset.get_path(index)
+        try:
+            start = time.perf_counter()
+            content = dataset.reader(path)
+            read_end = time.perf_counter()
+            image = Image.open(open_buffer(content))
+            if dataset.decode_max_size is not None:
+                image.draft(dataset.img_mode, (dataset.decode_max_size, dataset.decode_max_size))
+            image.load()
+            decode_end = time.perf_counter()
+            image = image.convert(dataset.img_mode)
+            convert_end = time.perf_counter()
+            data = dataset.transform(image)
+            transform_end = time.perf_counter()
+        except Exception as e:
+            logging.warning('[{}] broken: {}'.format(path, e))
+            broken.append(index)
+            continue
+        latencies['read'].append(read_end - start)
+        latencies['decode'].append(decode_end - read_end)
+        latencies['convert'].append(convert_end - decode_end)
+        latencies['transform'].append(transform_end - convert_end)
+        # labels as the dataset puts them in samples, for the configured collate_fn
+        samples.append({'data': data, 'label': dataset.format_label(dataset.imglist.label(index)), 'index': index})
+
+    results = {stage: summarize(values, len(values)) for stage, values in latencies.items() if values}
+    collate_latencies = []
+    batch = None
+    for start in range(0, len(samples) - batch_size + 1, batch_size):
+        collate_start = time.perf_counter()
+        batch = collate_fn(samples[start : start + batch_size])
+        collate_latencies.append(time.perf_counter() - collate_start)
+    if collate_latencies:
+        results['collate'] = summarize(collate_latencies, len(collate_latencies) * batch_size)
+    return results, batch, broken
+
+
+class _RepeatBatch(Dataset):
+
+    def __init__(self, batch, length):
+        self.batch = batch
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.batch
+
+
+def _iter_latencies(loader, warmup, record_manager=None):
+    # time between consecutive batches in the main process; the first
+    # batches pay for worker startup and are left out
+    latencies = []
+    last = None
+    for step, batch in enumerate(loader):
+        now = time.perf_counter()
+        if step >= warmup:
+            latencies.append(now - last)
+            if record_manager is not None:
+                record_timing(record_manager, batch['timing'], 'inf')
+        last = now
+    return latencies
+
+
+def bench_ipc(batch, batch_size, num_batches, warmup=2):
+    # a worker that hands out a ready batch does nothing but ship it, so what
+    # is left is the worker-to-main transfer
+    loader = DataLoader(_RepeatBatch(batch, num_batches + warmup), batch_size=None, num_workers=1)
+    latencies = _iter_latencies(loader, warmup)
+    return summarize(latencies, len(latencies) * batch_size)
+
+
+def bench_loader(dataset, indices, batch_size, num_workers, collate_fn=None, warmup=2):
+    loader = DataLoader(dataset, batch_size=batch_size, sampler=indices, num_workers=num_workers,
+                        collate_fn=collate_fn, drop_last=True)
+    # a profiling dataset also tells how long each stage takes inside the workers
+    record_manager = RecordManager() if dataset.profile else None
+    latencies = _iter_latencies(loader, warmup, record_manager)
+    if not latencies:
+        raise ValueError('need more than {} batches of {} samples, got {} samples'.format(
+            warmup, batch_size, len(indices)))
+    results = summarize(latencies, len(latencies) * batch_size)
+    if record_manager is not None:
+        results['stages'] = {
+            stage: {key: value * 1e3 for key, value in summary.items() if key in ('mean', 'p50', 'p90', 'p99')}
+            for stage, summary in record_manager.items('data_timing', stat=True)}
+    return results
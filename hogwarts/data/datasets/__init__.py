@@ -3,3 +3,7 @@ import time
 from .single_label_dataset import *
 from .multi_label_dataset import *
 from .base_dataset import *
+from .imglist import *
+from .streaming_dataset import *
+from .decode_cache import *
+from .blacklist import *
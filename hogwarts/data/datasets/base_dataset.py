@@ -1,21 +1,35 @@
-__all__ = ['BaseDataset']
+__all__ = ['BaseDataset', 'open_buffer', 'record_timing']
 
 
+import io
 import random
 import logging
 import traceback
 from torch.utils.data import Dataset
+from PIL import Image, UnidentifiedImageError
+from .blacklist import Blacklist
+
+
+# failures that come back on every retry: the file is gone or the reader
+# has no such key (its None fails to decode), or the bytes are no image.
+# Anything else, e.g. a storage timeout, skips the sample this once only
+_PERMANENT_ERRORS = (FileNotFoundError, UnidentifiedImageError, Image.DecompressionBombError)
 
 
 class BaseDataset(Dataset):
 
-    def __init__(self, pseudo_index=-1, skip_broken=True, new_index='next'):
+    def __init__(self, pseudo_index=-1, skip_broken=True, new_index='next', blacklist=None, profile=False):
         super(BaseDataset, self).__init__()
         self.pseudo_index = pseudo_index
         self.skip_broken = skip_broken
         self.new_index = new_index
+        # if profile is True, every sample carries sample['timing'], see record_timing
+        self.profile = profile
         if new_index not in ('next', 'rand'):
             raise ValueError('new_index not one of ["next", "rand"]')
+        # indices known to be broken, persisted in a file shared by workers and
+        # ranks; subclasses tie it to their imglist with check_source
+        self.blacklist = None if blacklist is None else Blacklist(blacklist)
 
     def __getitem__(self, index):
         # in some pytorch versions, input index will be torch.Tensor
@@ -28,16 +42,23 @@ class BaseDataset(Dataset):
         else:
             pseudo = 0
 
+        # known broken indices are remapped before paying for any read
+        if self.blacklist is not None and self.skip_broken:
+            if len(self.blacklist) >= len(self) and self.blacklist.count(len(self)) >= len(self):
+                raise RuntimeError('all indices are blacklisted in {}'.format(self.blacklist.fpath))
+            while index in self.blacklist:
+                self.blacklist.hits += 1
+                index = self._get_new_index(index)
+
         while True:
             try:
                 sample = self.getitem(index)
                 break
             except Exception as e:
                 if self.skip_broken and not isinstance(e, NotImplementedError):
-                    if self.new_index == 'next':
-                        new_index = (index + 1) % len(self)
-                    else:
-                        new_index = random.randrange(len(self))
+                    if self.blacklist is not None and isinstance(e, _PERMANENT_ERRORS):
+                        self.blacklist.add(index)
+                    new_index = self._get_new_index(index)
                     logging.warning('skip broken index [{}], use next index [{}]'.format(index, new_index))
                     index = new_index
                 else:
@@ -50,5 +71,36 @@ class BaseDataset(Dataset):
         sample['pseudo'] = pseudo
         return sample
 
+    def _get_new_index(self, index):
+        if self.new_index == 'next':
+            return (index + 1) % len(self)
+        return random.randrange(len(self))
+
+    def prefetch(self, indices):
+        # hand upcoming indices to a reader that can fetch ahead (e.g. PrefetchReader)
+        if not hasattr(self.reader, 'schedule'):
+            raise TypeError('reader {} does not support prefetching'.format(type(self.reader).__name__))
+        paths = (self.get_path(int(index)) for index in indices if int(index) != self.pseudo_index)
+        self.reader.schedule(paths)
+
+    def get_path(self, index):
+        raise NotImplementedError
+
     def getitem(self, index):
         raise NotImplementedError
+
+
+def open_buffer(content):
+    # io.BytesIO shares a bytes object and copies any other buffer (e.g. a
+    # memoryview of an mmap) once. PIL copies every chunk it reads into
+    # bytes anyway, so decoding straight from a buffer would save nothing
+    return io.BytesIO(content)
+
+
+def record_timing(record_manager, timing, window_size=10000, group='data_timing'):
+    # timing is batch['timing'] as collated from the samples of a profiling
+    # dataset, in ns; whichever worker made the batch, its samples end up in
+    # the same stat records, in seconds like RecordManager.record_time
+    for key, values in timing.items():
+        values = (values.double() / 1e9).tolist()
+        record_manager.record_value(key, values, window_size, 'stat', group)
@@ -0,0 +1,90 @@
+__all__ = ['Blacklist']
+
+
+import os
+import time
+from array import array
+
+
+class Blacklist:
+
+    def __init__(self, fpath, source=None, refresh_interval=10):
+        # the file is a flat sequence of int64 indices; every worker and rank
+        # appends what it finds and picks up what the others found. Indices
+        # only mean something for the imglist they came from, see check_source
+        self.fpath = str(fpath)
+        self.refresh_interval = refresh_interval
+        self.indices = set()
+        self.offset = 0
+        self.last_refresh = None
+        self.hits = 0
+        self.added = 0
+        dirname = os.path.dirname(self.fpath)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        if source is not None:
+            self.check_source(source)
+        self.refresh()
+
+    def check_source(self, source):
+        # the first one to open the blacklist records in a sidecar what its
+        # indices refer to (e.g. the imglist and root), any other is rejected
+        source_path = self.fpath + '.source'
+        tmp_path = '{}.{}.tmp'.format(source_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(source)
+        try:
+            # a hard link publishes the whole file or fails if one exists
+            os.link(tmp_path, source_path)
+        except FileExistsError:
+            with open(source_path) as f:
+                old_source = f.read()
+            if old_source != source:
+                raise ValueError('blacklist {} was built for {}, but got {}'.format(
+                    self.fpath, old_source, source))
+        finally:
+            os.unlink(tmp_path)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __contains__(self, index):
+        if time.monotonic() - self.last_refresh > self.refresh_interval:
+            self.refresh()
+        return index in self.indices
+
+    def count(self, stop):
+        # how many indices are below stop, e.g. the length of a maxlen dataset
+        return sum(1 for index in self.indices if 0 <= index < stop)
+
+    def refresh(self):
+        self.last_refresh = time.monotonic()
+        try:
+            size = os.path.getsize(self.fpath)
+        except FileNotFoundError:
+            return
+        # ignore a trailing partial record, it is re-read once complete
+        size -= size % 8
+        if size <= self.offset:
+            return
+        with open(self.fpath, 'rb') as f:
+            f.seek(self.offset)
+            records = array('q')
+            records.frombytes(f.read(size - self.offset))
+        self.indices.update(records)
+        self.offset = size
+
+    def add(self, index):
+        if index in self.indices:
+            return
+        self.indices.add(index)
+        self.added += 1
+        # a single O_APPEND write of 8 bytes, so concurrent writers never interleave
+        fd = os.open(self.fpath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, array('q', [index]).tobytes())
+        finally:
+            os.close(fd)
+
+    def stats(self):
+        return {'size': len(self.indices), 'hits': self.hits, 'added': self.added}
@@ -0,0 +1,86 @@
+__all__ = ['DecodeCache']
+
+
+import os
+import json
+import shutil
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+
+class DecodeCache:
+    # source identifies what the slots hold (e.g. the imglist and root), a
+    # cache built from anything else is rejected rather than served
+
+    def __init__(self, cache_dir, length, max_size, img_mode='RGB', source=None):
+        self.cache_dir = Path(cache_dir)
+        self.length = length
+        self.max_size = max_size
+        self.img_mode = img_mode
+        self.source = source
+        self.channels = Image.getmodebands(img_mode)
+
+        meta = {'length': length, 'max_size': max_size, 'img_mode': img_mode, 'source': source}
+        meta_path = self.cache_dir / 'meta.json'
+        if not meta_path.is_file():
+            self._create(meta)
+        if not meta_path.is_file():
+            raise ValueError('{} exists but is not a decode cache'.format(self.cache_dir))
+        with meta_path.open() as f:
+            old_meta = json.load(f)
+        if old_meta != meta:
+            raise ValueError('decode cache at {} was built with {}, but got {}'.format(
+                self.cache_dir, old_meta, meta))
+
+        # every slot fits a max_size x max_size image, the file stays sparse
+        # until slots are filled; shapes of 0 mark empty slots
+        self.pixels = np.memmap(str(self.cache_dir / 'pixels.bin'), dtype=np.uint8, mode='r+',
+                                shape=(length, max_size, max_size, self.channels))
+        self.shapes = np.memmap(str(self.cache_dir / 'shapes.bin'), dtype=np.int32, mode='r+',
+                                shape=(length, 2))
+
+    def _create(self, meta):
+        # ranks on a node start together: each builds the empty cache aside
+        # and renames it into place, so none truncates files another one has
+        # already mapped, and the first rename wins
+        tmp_dir = self.cache_dir.parent / '{}.{}.tmp'.format(self.cache_dir.name, os.getpid())
+        shutil.rmtree(str(tmp_dir), ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        sizes = {
+            'pixels.bin': self.length * self.max_size * self.max_size * self.channels,
+            'shapes.bin': self.length * 2 * np.dtype(np.int32).itemsize,
+        }
+        for name, size in sizes.items():
+            with (tmp_dir / name).open('wb') as f:
+                f.truncate(size)
+        with (tmp_dir / 'meta.json').open('w') as f:
+            json.dump(meta, f)
+        try:
+            tmp_dir.rename(self.cache_dir)
+        except OSError:
+            # another rank finished first
+            shutil.rmtree(str(tmp_dir), ignore_errors=True)
+
+    def get(self, index):
+        height, width = self.shapes[index]
+        # the two fields are stored one after the other, a slot being
+        # published may show just one of them
+        if height == 0 or width == 0:
+            return None
+        array = self.pixels[index, :height, :width]
+        if self.channels == 1:
+            array = array[:, :, 0]
+        return Image.fromarray(np.ascontiguousarray(array), self.img_mode)
+
+    def put(self, index, image):
+        if image.width > self.max_size or image.height > self.max_size:
+            image = image.copy()
+            image.thumbnail((self.max_size, self.max_size), Image.BILINEAR)
+        array = np.asarray(image, dtype=np.uint8)
+        if array.ndim == 2:
+            array = array[:, :, None]
+        self.pixels[index, :image.height, :image.width] = array
+        # publish the shape last, so readers never see a half-written slot
+        self.shapes[index] = (image.height, image.width)
+        return image
@@ -0,0 +1,211 @@
+__all__ = ['ImgList', 'SingleLabelImgList', 'MultiLabelImgList', 'parse_imglist']
+
+
+import os
+import shutil
+import hashlib
+from pathlib import Path
+from multiprocessing import Pool
+import numpy as np
+
+
+# A python list of (str, int) tuples touches a refcount on every access, so
+# forked DataLoader workers gradually copy the whole list page by page. These
+# containers keep the imglist in a handful of flat numpy arrays instead.
+
+
+class ImgList:
+
+    fields = ('names', 'name_offsets')
+
+    def __init__(self, names, name_offsets):
+        self.names = np.asarray(names, dtype=np.uint8)
+        self.name_offsets = np.asarray(name_offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.name_offsets) - 1
+
+    def __getitem__(self, index):
+        return self.name(index), self.label(index)
+
+    def _index(self, index):
+        # offsets are read at index and index + 1, so negative indices are
+        # turned into positive ones first, as a list would count them
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('imglist index out of range')
+        return index
+
+    def name(self, index):
+        index = self._index(index)
+        start, end = self.name_offsets[index], self.name_offsets[index + 1]
+        return self.names[start:end].tobytes().decode('utf8')
+
+    def label(self, index):
+        raise NotImplementedError
+
+    @property
+    def nbytes(self):
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+
+class SingleLabelImgList(ImgList):
+
+    fields = ImgList.fields + ('labels',)
+
+    def __init__(self, names, name_offsets, labels):
+        super(SingleLabelImgList, self).__init__(names, name_offsets)
+        self.labels = np.asarray(labels, dtype=np.int64)
+
+    def label(self, index):
+        return int(self.labels[index])
+
+
+class MultiLabelImgList(ImgList):
+
+    fields = ImgList.fields + ('labels', 'label_offsets')
+
+    def __init__(self, names, name_offsets, labels, label_offsets):
+        super(MultiLabelImgList, self).__init__(names, name_offsets)
+        # CSR layout: labels of item i are labels[label_offsets[i]:label_offsets[i + 1]]
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.label_offsets = np.asarray(label_offsets, dtype=np.int64)
+
+    def label(self, index):
+        index = self._index(index)
+        start, end = self.label_offsets[index], self.label_offsets[index + 1]
+        return self.labels[start:end].tolist()
+
+
+def _open_imglist(fpath):
+    fpath = str(fpath)
+    if fpath.endswith('.gz'):
+        import gzip
+        return gzip.open(fpath, 'rb')
+    if fpath.endswith('.zst'):
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(fpath, 'rb'), closefd=True)
+    return open(fpath, 'rb')
+
+
+def _iter_chunks(fpath, chunk_size):
+    # yield blocks of whole lines, so chunks can be parsed independently
+    with _open_imglist(fpath) as f:
+        remain = b''
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            block = remain + block
+            end = block.rfind(b'\n') + 1
+            if end == 0:
+                remain = block
+                continue
+            remain = block[end:]
+            yield block[:end]
+        if remain:
+            yield remain
+
+
+def _two_tokens_per_line(data, num_lines):
+    # the token count alone lets errors cancel out ("a 1 7" then "5"), so
+    # check that whitespace (and any control byte) alternates between one
+    # space or tab and one newline, which leaves no room for anything else
+    array = np.frombuffer(data, dtype=np.uint8)
+    blanks = array[array <= ord(' ')]
+    if len(blanks) != 2 * num_lines - (not data.endswith(b'\n')):
+        return False
+    separators, newlines = blanks[0::2], blanks[1::2]
+    return bool(np.all((separators == ord(' ')) | (separators == ord('\t'))) and np.all(newlines == ord('\n')))
+
+
+def _parse_chunk(args):
+    data, multi_label = args
+    label_counts = None
+    tokens = data.split()
+    num_lines = data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+    if not multi_label and len(tokens) == 2 * num_lines and _two_tokens_per_line(data, num_lines):
+        # fast path: every line is exactly "<name> <label>"
+        names, labels = tokens[0::2], tokens[1::2]
+    else:
+        names, labels, label_counts = [], [], []
+        for line in data.splitlines():
+            tokens = line.split()
+            if not tokens:
+                continue
+            if len(tokens) < 2 or (not multi_label and len(tokens) > 2):
+                raise ValueError('invalid imglist line: {}'.format(line.decode('utf8', 'replace')))
+            names.append(tokens[0])
+            labels.extend(tokens[1:])
+            label_counts.append(len(tokens) - 1)
+
+    name_lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+    names = np.frombuffer(b''.join(names), dtype=np.uint8)
+    labels = np.array(labels, dtype=np.bytes_).astype(np.int64) if labels else np.zeros(0, np.int64)
+    if label_counts is not None:
+        label_counts = np.array(label_counts, dtype=np.int64)
+    return names, name_lengths, labels, label_counts
+
+
+def _cache_key(fpath, multi_label):
+    # size + mtime catch almost every change, the head/tail hash the rest,
+    # without reading a multi-GB list in full
+    stat = os.stat(fpath)
+    digest = hashlib.sha1('{}:{}:{}:{}'.format(
+        os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns, multi_label).encode('utf8'))
+    with open(fpath, 'rb') as f:
+        digest.update(f.read(1 << 20))
+        f.seek(max(0, stat.st_size - (1 << 20)))
+        digest.update(f.read(1 << 20))
+    return digest.hexdigest()[:16]
+
+
+def _load_cache(cache_path, multi_label):
+    cls = MultiLabelImgList if multi_label else SingleLabelImgList
+    arrays = [np.load(str(cache_path / '{}.npy'.format(field)), mmap_mode='r') for field in cls.fields]
+    return cls(*arrays)
+
+
+def _save_cache(imglist, cache_path):
+    tmp_path = cache_path.with_name('{}.{}.tmp'.format(cache_path.name, os.getpid()))
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    for field in imglist.fields:
+        np.save(str(tmp_path / '{}.npy'.format(field)), getattr(imglist, field))
+    try:
+        tmp_path.rename(cache_path)
+    except OSError:
+        # another rank finished first
+        shutil.rmtree(str(tmp_path), ignore_errors=True)
+
+
+def parse_imglist(fpath, multi_label=False, num_workers=1, cache_dir=None, chunk_size=64 << 20):
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / '{}.{}'.format(Path(fpath).name, _cache_key(fpath, multi_label))
+        if cache_path.is_dir():
+            return _load_cache(cache_path, multi_label)
+
+    chunks = ((data, multi_label) for data in _iter_chunks(fpath, chunk_size))
+    if num_workers > 1:
+        with Pool(num_workers) as pool:
+            results = list(pool.imap(_parse_chunk, chunks))
+    else:
+        results = [_parse_chunk(args) for args in chunks]
+    if not results:
+        results = [_parse_chunk((b'', multi_label))]
+
+    names = np.concatenate([result[0] for result in results])
+    name_offsets = np.zeros(sum(len(result[1]) for result in results) + 1, dtype=np.int64)
+    np.cumsum(np.concatenate([result[1] for result in results]), out=name_offsets[1:])
+    labels = np.concatenate([result[2] for result in results])
+    if multi_label:
+        label_offsets = np.zeros(len(name_offsets), dtype=np.int64)
+        np.cumsum(np.concatenate([result[3] for result in results]), out=label_offsets[1:])
+        imglist = MultiLabelImgList(names, name_offsets, labels, label_offsets)
+    else:
+        imglist = SingleLabelImgList(names, name_offsets, labels)
+
+    if cache_dir is not None:
+        _save_cache(imglist, cache_path)
+    return imglist
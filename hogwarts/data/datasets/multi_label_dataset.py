@@ -1,12 +1,15 @@
-__all__ = ['MultiLabelDataset']
+__all__ = ['MultiLabelDataset', 'MultiLabelCollate']
 
 
 import os
-import io
+import time
 import logging
 import torch
+from torch.utils.data.dataloader import default_collate
 from PIL import Image, ImageFile
-from .base_dataset import BaseDataset
+from .base_dataset import BaseDataset, open_buffer
+from .imglist import parse_imglist, _cache_key
+from .decode_cache import DecodeCache
 
 # to fix "OSError: image file is truncated"
 ImageFile.LOAD_TRUNCATED_IMAGES = True
@@ -15,7 +18,9 @@ ImageFile.LOAD_TRUNCATED_IMAGES = True
 class MultiLabelDataset(BaseDataset):
 
     def __init__(self, imglist, root, reader, transform, num_classes,
-                 img_mode='RGB', maxlen=None, dummy_read=False, dummy_size=None, **kwargs):
+                 img_mode='RGB', maxlen=None, dummy_read=False, dummy_size=None,
+                 imglist_workers=1, imglist_cache=None, decode_cache=None, decode_cache_size=None,
+                 decode_max_size=None, label_format='dense', **kwargs):
         super(MultiLabelDataset, self).__init__(**kwargs)
 
         self.root = root
@@ -26,43 +31,130 @@ class MultiLabelDataset(BaseDataset):
         self.maxlen = maxlen
         self.dummy_read = dummy_read
         self.dummy_size = dummy_size
+        self.decode_max_size = decode_max_size
+        self.label_format = label_format
         if dummy_read and dummy_size is None:
             raise ValueError('if dummy_read is True, should provide dummy_size')
+        if label_format not in ('dense', 'indices'):
+            raise ValueError('label_format not one of ["dense", "indices"]')
 
-        self.imglist = []
-        with open(imglist) as f:
-            for line in f.readlines():
-                path, label = line.strip().split(maxsplit=1)
-                label = [int(l) for l in label.split()]
-                self.imglist.append((path, label))
+        self.imglist = parse_imglist(imglist, multi_label=True,
+                                     num_workers=imglist_workers, cache_dir=imglist_cache)
+        if self.blacklist is not None:
+            # indices do not depend on how labels are parsed
+            self.blacklist.check_source('{}:{}'.format(_cache_key(imglist, None), root))
+
+        self.decode_cache = None
+        if decode_cache is not None:
+            if decode_cache_size is None:
+                raise ValueError('if decode_cache is given, should provide decode_cache_size')
+            self.decode_cache = DecodeCache(decode_cache, len(self.imglist), decode_cache_size, img_mode,
+                                            source='{}:{}'.format(_cache_key(imglist, True), root))
 
     def __len__(self):
         if self.maxlen is None:
             return len(self.imglist)
         return min(len(self.imglist), self.maxlen)
 
-    def getitem(self, index):
-        image_name, label = self.imglist[index]
+    def get_path(self, index):
+        return self.join_root(self.imglist.name(index))
+
+    def join_root(self, image_name):
         if self.root != '' and image_name.startswith('/'):
             raise RuntimeError('root not empty but image_name starts with "/"')
-        path = os.path.join(self.root, image_name)
+        return os.path.join(self.root, image_name)
+
+    def getitem(self, index):
+        return self.load(self.get_path(index), self.imglist.label(index), index)
 
+    def load_image(self, path, index, timing=None):
+        # if timing is given, read and decode durations are put in it, in ns
+        start = time.monotonic_ns() if timing is not None else None
+        # decoded pixels are shared through the cache, random transforms still
+        # run on every access
+        if self.decode_cache is not None:
+            image = self.decode_cache.get(index)
+            if image is not None:
+                if timing is not None:
+                    timing['read'] = 0
+                    timing['decode'] = time.monotonic_ns() - start
+                return image
+        filebytes = self.reader(path)
+        if timing is not None:
+            read_end = time.monotonic_ns()
+            timing['read'] = read_end - start
+        buff = open_buffer(filebytes)
+        image = Image.open(buff)
+        if self.decode_max_size is not None:
+            # let JPEG decode at 1/2, 1/4 or 1/8 scale, keeping both sides >= decode_max_size
+            image.draft(self.img_mode, (self.decode_max_size, self.decode_max_size))
+        image = image.convert(self.img_mode)
+        if self.decode_cache is not None:
+            image = self.decode_cache.put(index, image)
+        if timing is not None:
+            timing['decode'] = time.monotonic_ns() - read_end
+        return image
+
+    def format_label(self, label):
         dense_label = torch.LongTensor(label)
+        if self.label_format == 'indices':
+            # a handful of class indices per sample, MultiLabelCollate builds the batch
+            return dense_label
         onehot_label = torch.zeros(self.num_classes)
         onehot_label.scatter_(0, dense_label, 1)
-        sample = {'label': onehot_label}
+        return onehot_label
+
+    def load(self, path, label, index):
+        sample = {'label': self.format_label(label)}
+        timing = {} if self.profile else None
         try:
-            if not self.dummy_read:
-                filebytes = self.reader(path)
-                buff = io.BytesIO(filebytes)
-            if self.dummy_size is not None:
-                sample['data'] = torch.rand(self.dummy_size)
-            else:
-                image = Image.open(buff)
-                image = image.convert(self.img_mode)
+            if self.dummy_size is None:
+                image = self.load_image(path, index, timing)
+                if timing is not None:
+                    transform_start = time.monotonic_ns()
                 sample['data'] = self.transform(image)
+                if timing is not None:
+                    timing['transform'] = time.monotonic_ns() - transform_start
+            else:
+                if timing is not None:
+                    read_start = time.monotonic_ns()
+                if not self.dummy_read:
+                    self.reader(path)
+                if timing is not None:
+                    timing.update(read=time.monotonic_ns() - read_start, decode=0, transform=0)
+                sample['data'] = torch.rand(self.dummy_size)
         except Exception as e:
             logging.error('[{}] broken'.format(path))
             raise e
 
+        if timing is not None:
+            sample['timing'] = timing
         return sample
+
+
+class MultiLabelCollate:
+
+    def __init__(self, num_classes, sparse=False):
+        self.num_classes = num_classes
+        self.sparse = sparse
+
+    def __call__(self, samples):
+        labels = [sample['label'] for sample in samples]
+        batch = default_collate([{key: value for key, value in sample.items() if key != 'label'}
+                                 for sample in samples])
+
+        # one scatter for the whole batch instead of a dense one-hot per sample
+        lengths = torch.LongTensor([len(label) for label in labels])
+        cols = torch.cat(labels)
+        rows = torch.arange(len(labels)).repeat_interleave(lengths)
+        if self.sparse:
+            indices = torch.stack([rows, cols])
+            values = torch.ones(len(cols))
+            label = torch.sparse_coo_tensor(indices, values, (len(labels), self.num_classes)).coalesce()
+            # repeated labels were summed by coalesce
+            label.values().clamp_(max=1)
+            batch['label'] = label
+        else:
+            batch['label'] = torch.zeros(len(labels), self.num_classes)
+            batch['label'][rows, cols] = 1
+        return batch
@@ -2,11 +2,13 @@ __all__ = ['SingleLabelDataset']
 
 
 import os
-import io
+import time
 import logging
 import torch
 from PIL import Image, ImageFile
-from .base_dataset import BaseDataset
+from .base_dataset import BaseDataset, open_buffer
+from .imglist import parse_imglist, _cache_key
+from .decode_cache import DecodeCache
 
 # to fix "OSError: image file is truncated"
 ImageFile.LOAD_TRUNCATED_IMAGES = True
@@ -15,7 +17,9 @@ ImageFile.LOAD_TRUNCATED_IMAGES = True
 class SingleLabelDataset(BaseDataset):
 
     def __init__(self, imglist, root, reader, transform,
-                 img_mode='RGB', maxlen=None, dummy_read=False, dummy_size=None, **kwargs):
+                 img_mode='RGB', maxlen=None, dummy_read=False, dummy_size=None,
+                 imglist_workers=1, imglist_cache=None, decode_cache=None, decode_cache_size=None,
+                 decode_max_size=None, **kwargs):
         super(SingleLabelDataset, self).__init__(**kwargs)
 
         self.root = root
@@ -25,39 +29,93 @@ class SingleLabelDataset(BaseDataset):
         self.maxlen = maxlen
         self.dummy_read = dummy_read
         self.dummy_size = dummy_size
+        self.decode_max_size = decode_max_size
         if dummy_read and dummy_size is None:
             raise ValueError('if dummy_read is True, should provide dummy_size')
 
-        self.imglist = []
-        with open(imglist) as f:
-            for line in f.readlines():
-                path, label = line.strip().split(maxsplit=1)
-                label = int(label)
-                self.imglist.append((path, label))
+        self.imglist = parse_imglist(imglist, multi_label=False,
+                                     num_workers=imglist_workers, cache_dir=imglist_cache)
+        if self.blacklist is not None:
+            # indices do not depend on how labels are parsed
+            self.blacklist.check_source('{}:{}'.format(_cache_key(imglist, None), root))
+
+        self.decode_cache = None
+        if decode_cache is not None:
+            if decode_cache_size is None:
+                raise ValueError('if decode_cache is given, should provide decode_cache_size')
+            self.decode_cache = DecodeCache(decode_cache, len(self.imglist), decode_cache_size, img_mode,
+                                            source='{}:{}'.format(_cache_key(imglist, False), root))
 
     def __len__(self):
         if self.maxlen is None:
             return len(self.imglist)
         return min(len(self.imglist), self.maxlen)
 
-    def getitem(self, index):
-        image_name, label = self.imglist[index]
+    def get_path(self, index):
+        return self.join_root(self.imglist.name(index))
+
+    def join_root(self, image_name):
         if self.root != '' and image_name.startswith('/'):
             raise RuntimeError('root not empty but image_name starts with "/"')
-        path = os.path.join(self.root, image_name)
-        sample = {'label': label}
+        return os.path.join(self.root, image_name)
+
+    def getitem(self, index):
+        return self.load(self.get_path(index), self.imglist.label(index), index)
+
+    def load_image(self, path, index, timing=None):
+        # if timing is given, read and decode durations are put in it, in ns
+        start = time.monotonic_ns() if timing is not None else None
+        # decoded pixels are shared through the cache, random transforms still
+        # run on every access
+        if self.decode_cache is not None:
+            image = self.decode_cache.get(index)
+            if image is not None:
+                if timing is not None:
+                    timing['read'] = 0
+                    timing['decode'] = time.monotonic_ns() - start
+                return image
+        filebytes = self.reader(path)
+        if timing is not None:
+            read_end = time.monotonic_ns()
+            timing['read'] = read_end - start
+        buff = open_buffer(filebytes)
+        image = Image.open(buff)
+        if self.decode_max_size is not None:
+            # let JPEG decode at 1/2, 1/4 or 1/8 scale, keeping both sides >= decode_max_size
+            image.draft(self.img_mode, (self.decode_max_size, self.decode_max_size))
+        image = image.convert(self.img_mode)
+        if self.decode_cache is not None:
+            image = self.decode_cache.put(index, image)
+        if timing is not None:
+            timing['decode'] = time.monotonic_ns() - read_end
+        return image
+
+    def format_label(self, label):
+        return label
+
+    def load(self, path, label, index):
+        sample = {'label': self.format_label(label)}
+        timing = {} if self.profile else None
         try:
-            if not self.dummy_read:
-                filebytes = self.reader(path)
-                buff = io.BytesIO(filebytes)
-            if self.dummy_size is not None:
-                sample['data'] = torch.rand(self.dummy_size)
-            else:
-                image = Image.open(buff)
-                image = image.convert(self.img_mode)
+            if self.dummy_size is None:
+                image = self.load_image(path, index, timing)
+                if timing is not None:
+                    transform_start = time.monotonic_ns()
                 sample['data'] = self.transform(image)
+                if timing is not None:
+                    timing['transform'] = time.monotonic_ns() - transform_start
+            else:
+                if timing is not None:
+                    read_start = time.monotonic_ns()
+                if not self.dummy_read:
+                    self.reader(path)
+                if timing is not None:
+                    timing.update(read=time.monotonic_ns() - read_start, decode=0, transform=0)
+                sample['data'] = torch.rand(self.dummy_size)
         except Exception as e:
             logging.error('[{}] broken'.format(path))
             raise e
 
+        if timing is not None:
+            sample['timing'] = timing
         return sample
@@ -0,0 +1,261 @@
+__all__ = ['StreamingDataset', 'StreamingSingleLabelDataset', 'StreamingMultiLabelDataset']
+
+
+import os
+import math
+import random
+import logging
+import traceback
+from collections import deque
+from torch.utils.data import IterableDataset, get_worker_info
+from ... import distributed as dist
+from .imglist import _open_imglist
+from .single_label_dataset import SingleLabelDataset
+from .multi_label_dataset import MultiLabelDataset
+
+
+class StreamingDataset(IterableDataset):
+    # every (rank, worker) pair reads its own part of the list: a plain list
+    # is split into byte ranges, so each only parses its range (and counts,
+    # without parsing, the lines before it). A .gz / .zst list, or any list
+    # with maxlen, is dealt round-robin by line instead, and then every pair
+    # decompresses the whole list, world_size * num_workers times per epoch,
+    # though it only splits its own lines. Ranks only yield
+    # the same number of samples, as DDP needs, if the length is known:
+    # pass length (the number of lines) or maxlen, and every rank then yields
+    # exactly ceil(min(length, maxlen) / world_size) samples, stopping early
+    # or repeating its own samples from the start as needed
+
+    def __init__(self, imglist, shuffle_buffer=0, seed=0, maxlen=None, skip_broken=True, new_index='next',
+                 profile=False, length=None):
+        super(StreamingDataset, self).__init__()
+        self.imglist = imglist
+        self.length = length
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.maxlen = maxlen
+        self.skip_broken = skip_broken
+        self.new_index = new_index
+        self.profile = profile
+        self.epoch = 0
+        if new_index not in ('next', 'rand'):
+            raise ValueError('new_index not one of ["next", "rand"]')
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _total(self):
+        lengths = [length for length in (self.length, self.maxlen) if length is not None]
+        return min(lengths) if lengths else None
+
+    def __len__(self):
+        # per rank, as DistributedSampler does
+        total = self._total()
+        if total is None:
+            raise TypeError('length of {} is unknown without length or maxlen'.format(type(self).__name__))
+        return int(math.ceil(total / dist.get_world_size()))
+
+    def _quota(self):
+        # how many samples this worker yields, None if unbounded
+        if self._total() is None:
+            return None
+        worker_info = get_worker_info()
+        num_workers, worker_id = (1, 0) if worker_info is None else (worker_info.num_workers, worker_info.id)
+        rank_quota = len(self)
+        return rank_quota // num_workers + (worker_id < rank_quota % num_workers)
+
+    def _shard(self):
+        worker_info = get_worker_info()
+        if worker_info is None:
+            num_workers, worker_id = 1, 0
+        else:
+            num_workers, worker_id = worker_info.num_workers, worker_info.id
+        num_shards = dist.get_world_size() * num_workers
+        shard_id = dist.get_rank() * num_workers + worker_id
+        return shard_id, num_shards
+
+    def _iter_strided(self, shard_id, num_shards):
+        with _open_imglist(self.imglist) as f:
+            for index, line in enumerate(f):
+                if self.maxlen is not None and index >= self.maxlen:
+                    break
+                if index % num_shards == shard_id:
+                    yield index, line
+
+    def _iter_range(self, shard_id, num_shards):
+        # a line belongs to the range its first byte is in; with maxlen the
+        # first maxlen lines would have to be split evenly, so it is strided
+        size = os.path.getsize(self.imglist)
+        start, stop = size * shard_id // num_shards, size * (shard_id + 1) // num_shards
+        with open(self.imglist, 'rb') as f:
+            pos = 0
+            if start > 0:
+                f.seek(start - 1)
+                pos = start - 1 + len(f.readline())
+            index = _count_lines(f, pos)
+            f.seek(pos)
+            while pos < stop:
+                line = f.readline()
+                if not line:
+                    break
+                yield index, line
+                pos += len(line)
+                index += 1
+
+    def _iter_items(self, shard_id, num_shards):
+        if self.maxlen is None and not str(self.imglist).endswith(('.gz', '.zst')):
+            lines = self._iter_range(shard_id, num_shards)
+        else:
+            lines = self._iter_strided(shard_id, num_shards)
+        for index, line in lines:
+            tokens = line.split()
+            if not tokens:
+                continue
+            yield index, tokens[0].decode('utf8'), self.parse_label(tokens[1:])
+
+    def _iter_shuffled(self, items, rng):
+        # bounded shuffle: memory stays at shuffle_buffer items however long the list is
+        buffer = []
+        for item in items:
+            if self.shuffle_buffer <= 1:
+                yield item
+                continue
+            buffer.append(item)
+            if len(buffer) < self.shuffle_buffer:
+                continue
+            pos = rng.randrange(len(buffer))
+            buffer[pos], buffer[-1] = buffer[-1], buffer[pos]
+            yield buffer.pop()
+        rng.shuffle(buffer)
+        for item in buffer:
+            yield item
+
+    def _iter_cycled(self, shard_id, num_shards, cycle):
+        # the shard, and if cycle, its own items again and again; __iter__
+        # stops at the quota, whatever broken samples consumed on the way
+        while True:
+            num_items = 0
+            for item in self._iter_items(shard_id, num_shards):
+                num_items += 1
+                yield item
+            if not cycle or num_items == 0:
+                return
+
+    def __iter__(self):
+        shard_id, num_shards = self._shard()
+        quota = self._quota()
+        if quota == 0:
+            return
+        rng = random.Random('{}-{}-{}'.format(self.seed, self.epoch, shard_id))
+        items = self._iter_shuffled(self._iter_cycled(shard_id, num_shards, quota is not None), rng)
+        recent = deque(maxlen=max(self.shuffle_buffer, 1))
+        num_yielded = 0
+        for index, image_name, label in items:
+            # a broken sample is replaced by the next one in the stream, or by
+            # a random recently seen one, like BaseDataset's new_index
+            while True:
+                try:
+                    sample = self.load(self.join_root(image_name), label, index)
+                    break
+                except Exception as e:
+                    if not self.skip_broken or isinstance(e, NotImplementedError):
+                        logging.error('index [{}] broken'.format(index))
+                        traceback.print_exc()
+                        logging.error(e)
+                        raise e
+                    if self.new_index == 'rand' and recent:
+                        new_item = rng.choice(recent)
+                    else:
+                        new_item = next(items, None)
+                    if new_item is None:
+                        logging.warning('skip broken index [{}], stream exhausted'.format(index))
+                        return
+                    logging.warning('skip broken index [{}], use next index [{}]'.format(index, new_item[0]))
+                    index, image_name, label = new_item
+
+            if self.new_index == 'rand':
+                recent.append((index, image_name, label))
+            sample['index'] = index
+            sample['pseudo'] = 0
+            yield sample
+            num_yielded += 1
+            if num_yielded == quota:
+                return
+
+    def parse_label(self, tokens):
+        raise NotImplementedError
+
+    def join_root(self, image_name):
+        raise NotImplementedError
+
+    def load(self, path, label, index):
+        raise NotImplementedError
+
+
+def _count_lines(f, stop, block_size=16 << 20):
+    # newlines in the first stop bytes, counted without splitting them
+    f.seek(0)
+    count = 0
+    while stop > 0:
+        block = f.read(min(block_size, stop))
+        if not block:
+            break
+        count += block.count(b'\n')
+        stop -= len(block)
+    return count
+
+
+class StreamingSingleLabelDataset(StreamingDataset):
+
+    def __init__(self, imglist, root, reader, transform,
+                 img_mode='RGB', dummy_read=False, dummy_size=None, decode_max_size=None, **kwargs):
+        super(StreamingSingleLabelDataset, self).__init__(imglist, **kwargs)
+        self.root = root
+        self.reader = reader
+        self.transform = transform
+        self.img_mode = img_mode
+        self.dummy_read = dummy_read
+        self.dummy_size = dummy_size
+        self.decode_max_size = decode_max_size
+        # the number of lines is unknown up front, so no decode cache
+        self.decode_cache = None
+        if dummy_read and dummy_size is None:
+            raise ValueError('if dummy_read is True, should provide dummy_size')
+
+    def parse_label(self, tokens):
+        label, = tokens
+        return int(label)
+
+    join_root = SingleLabelDataset.join_root
+    load_image = SingleLabelDataset.load_image
+    load = SingleLabelDataset.load
+
+
+class StreamingMultiLabelDataset(StreamingDataset):
+
+    def __init__(self, imglist, root, reader, transform, num_classes,
+                 img_mode='RGB', dummy_read=False, dummy_size=None, decode_max_size=None,
+                 label_format='dense', **kwargs):
+        super(StreamingMultiLabelDataset, self).__init__(imglist, **kwargs)
+        self.root = root
+        self.reader = reader
+        self.transform = transform
+        self.num_classes = num_classes
+        self.label_format = label_format
+        self.img_mode = img_mode
+        self.dummy_read = dummy_read
+        self.dummy_size = dummy_size
+        self.decode_max_size = decode_max_size
+        # the number of lines is unknown up front, so no decode cache
+        self.decode_cache = None
+        if dummy_read and dummy_size is None:
+            raise ValueError('if dummy_read is True, should provide dummy_size')
+        if label_format not in ('dense', 'indices'):
+            raise ValueError('label_format not one of ["dense", "indices"]')
+
+    def parse_label(self, tokens):
+        return [int(label) for label in tokens]
+
+    join_root = MultiLabelDataset.join_root
+    load_image = MultiLabelDataset.load_image
+    load = MultiLabelDataset.load
@@ -0,0 +1,252 @@
+__all__ = ['FakeS3Client', 'bench_read_many', 'bench_lmdb', 'bench_imglist_memory',
+           'bench_label_format', 'bench_decode']
+
+
+import os
+import time
+import json
+import pickle
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+
+# Benchmarks of single components, apart from the whole pipeline hbench
+# times, e.g. python -m hogwarts.data.microbench read_many
+
+
+class FakeS3Client:
+    # an in-process stand-in for ceph.S3Client: every Get waits latency
+    # seconds without holding the GIL, as a socket read would, and returns
+    # the same size random bytes
+
+    def __init__(self, latency=0.005, size=100 << 10):
+        self.latency = latency
+        self.content = os.urandom(size)
+
+    def Get(self, path):
+        time.sleep(self.latency)
+        return self.content
+
+
+def _rate(fn, num_items, repeat):
+    # items per second over repeat calls, after one warmup call
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return num_items * repeat / (time.perf_counter() - start)
+
+
+def bench_read_many(num_paths=256, latency=0.005, size=100 << 10, max_workers=(1, 4, 16, 64), repeat=3):
+    # CephReader one GET at a time against read_many, on a fake client, so
+    # only the overlap of requests is measured
+    from .readers.ceph_reader import CephReader
+
+    paths = ['fake/{:08d}.jpg'.format(i) for i in range(num_paths)]
+
+    def client_factory():
+        return FakeS3Client(latency, size)
+
+    reader = CephReader(client_factory=client_factory)
+    results = {
+        'num_paths': num_paths,
+        'latency_ms': latency * 1e3,
+        'size': size,
+        'sequential_per_sec': _rate(lambda: [reader(path) for path in paths], num_paths, repeat),
+        'read_many_per_sec': {},
+    }
+    for num_workers in max_workers:
+        reader = CephReader(num_workers, client_factory=client_factory)
+        results['read_many_per_sec'][num_workers] = _rate(lambda: reader.read_many(paths), num_paths, repeat)
+    return results
+
+
+def bench_lmdb(lmdb_path, num_keys=10000, batch_size=64, repeat=3, seed=0):
+    # keys/s and bytes/s of LMDBReader's reused transaction and get_many,
+    # against what it did before: a fresh begin() for every key
+    import lmdb
+    from .readers.lmdb_reader import LMDBReader, _open_env
+
+    reader = LMDBReader(lmdb_path)
+    env = _open_env(lmdb_path)
+    with env.begin(write=False) as txn:
+        keys = [key.decode(reader.coding) for key in txn.cursor().iternext(values=False)]
+    keys = random.Random(seed).sample(keys, min(num_keys, len(keys)))
+    num_bytes = sum(len(value) for value in reader.get_many(keys))
+
+    def per_key_begin():
+        for key in keys:
+            with env.begin(write=False) as txn:
+                txn.get(key.encode(reader.coding))
+
+    def reused_txn():
+        for key in keys:
+            reader(key)
+
+    def get_many():
+        for start in range(0, len(keys), batch_size):
+            reader.get_many(keys[start : start + batch_size])
+
+    results = {'num_keys': len(keys), 'batch_size': batch_size, 'lmdb_version': lmdb.__version__}
+    for name, fn in (('per_key_begin', per_key_begin), ('reused_txn', reused_txn), ('get_many', get_many)):
+        keys_per_sec = _rate(fn, len(keys), repeat)
+        results[name] = {'keys_per_sec': keys_per_sec, 'bytes_per_sec': keys_per_sec * num_bytes / len(keys)}
+    return results
+
+
+def _private_bytes():
+    # pages of this process no other process shares, e.g. copied on write
+    with open('/proc/self/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line)
+    return sum(int(fields[key].split()[0]) << 10 for key in ('Private_Clean', 'Private_Dirty'))
+
+
+def _touch_all(items, queue):
+    before = _private_bytes()
+    for index in range(len(items)):
+        items[index]
+    queue.put(_private_bytes() - before)
+
+
+def bench_imglist_memory(num_items=1000000, num_workers=4):
+    # how much of the imglist each forked worker ends up copying after one
+    # pass over it, for a list of (name, label) tuples against ImgList.
+    # Linux only, it reads /proc/self/smaps_rollup
+    from .datasets.imglist import parse_imglist
+
+    with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+        for index in range(num_items):
+            f.write('train/n{:08d}/{:08d}.JPEG {}\n'.format(index % 1000, index, index % 1000))
+        f.flush()
+        imglist = parse_imglist(f.name)
+    tuples = [imglist[index] for index in range(len(imglist))]
+
+    context = multiprocessing.get_context('fork')
+    results = {'num_items': num_items, 'num_workers': num_workers, 'imglist_nbytes': imglist.nbytes}
+    for name, items in (('tuples', tuples), ('imglist', imglist)):
+        queue = context.SimpleQueue()
+        workers = [context.Process(target=_touch_all, args=(items, queue)) for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        copied = [queue.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        results[name] = {'copied_per_worker': sum(copied) / len(copied), 'copied_total': sum(copied)}
+    return results
+
+
+def bench_label_format(num_classes=10000, labels_per_sample=5, batch_size=256, num_batches=20, seed=0):
+    # MultiLabelDataset's labels per format, from per-sample tensor to
+    # collated batch: pickled bytes (what a worker ships without shared
+    # memory) and samples/s of building and collating them
+    import torch
+    from torch.utils.data.dataloader import default_collate
+    from .datasets.multi_label_dataset import MultiLabelCollate
+
+    rng = random.Random(seed)
+    labels = [rng.sample(range(num_classes), labels_per_sample) for _ in range(batch_size)]
+
+    def dense():
+        samples = []
+        for index, label in enumerate(labels):
+            onehot_label = torch.zeros(num_classes)
+            onehot_label.scatter_(0, torch.LongTensor(label), 1)
+            samples.append({'label': onehot_label, 'index': index})
+        return samples, default_collate
+
+    def indices(sparse):
+        samples = [{'label': torch.LongTensor(label), 'index': index} for index, label in enumerate(labels)]
+        return samples, MultiLabelCollate(num_classes, sparse)
+
+    results = {'num_classes': num_classes, 'labels_per_sample': labels_per_sample, 'batch_size': batch_size}
+    for name, build in (('dense', dense), ('indices', lambda: indices(False)),
+                        ('indices_sparse', lambda: indices(True))):
+        samples, collate_fn = build()
+        batch = collate_fn(samples)
+
+        def run():
+            for _ in range(num_batches):
+                samples, collate_fn = build()
+                collate_fn(samples)
+
+        results[name] = {
+            'sample_bytes': len(pickle.dumps(samples[0])),
+            'batch_bytes': len(pickle.dumps(batch)),
+            'samples_per_sec': _rate(run, num_batches * batch_size, 1),
+        }
+    return results
+
+
+def bench_decode(imglist, root, decode_max_size, num_samples=256, img_mode='RGB', seed=0):
+    # decode as load_image does, with and without the JPEG draft to
+    # decode_max_size, on images read into memory first
+    from PIL import Image
+    from .bench import summarize
+    from .readers import DirectReader
+    from .datasets.imglist import parse_imglist
+    from .datasets.base_dataset import open_buffer
+
+    imglist = parse_imglist(imglist)
+    indices = random.Random(seed).sample(range(len(imglist)), min(num_samples, len(imglist)))
+    reader = DirectReader()
+    contents = [reader(os.path.join(root, imglist.name(index))) for index in indices]
+
+    results = {'num_samples': len(contents), 'decode_max_size': decode_max_size}
+    for name, max_size in (('baseline', None), ('draft', decode_max_size)):
+        latencies = []
+        num_pixels = 0
+        for content in contents:
+            start = time.perf_counter()
+            image = Image.open(open_buffer(content))
+            if max_size is not None:
+                image.draft(img_mode, (max_size, max_size))
+            image = image.convert(img_mode)
+            latencies.append(time.perf_counter() - start)
+            num_pixels += image.width * image.height
+        results[name] = summarize(latencies, len(latencies))
+        results[name]['mean_pixels'] = num_pixels / len(contents)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='bench', required=True)
+    sub = subparsers.add_parser('read_many', help='CephReader sequential vs read_many, on a fake client')
+    sub.add_argument('--num-paths', type=int, default=256)
+    sub.add_argument('--latency', type=float, default=0.005, help='seconds per GET')
+    sub.add_argument('--size', type=int, default=100 << 10)
+    sub.add_argument('--max-workers', type=int, nargs='+', default=[1, 4, 16, 64])
+    sub.add_argument('--repeat', type=int, default=3)
+    sub = subparsers.add_parser('lmdb', help='LMDBReader per-key begin vs reused txn vs get_many')
+    sub.add_argument('lmdb_path')
+    sub.add_argument('--num-keys', type=int, default=10000)
+    sub.add_argument('--batch-size', '-b', type=int, default=64)
+    sub.add_argument('--repeat', type=int, default=3)
+    sub.add_argument('--seed', type=int, default=0)
+    sub = subparsers.add_parser('imglist_memory', help='memory copied by forked workers, tuples vs ImgList')
+    sub.add_argument('--num-items', type=int, default=1000000)
+    sub.add_argument('--num-workers', '-j', type=int, default=4)
+    sub = subparsers.add_parser('label_format', help='MultiLabelDataset dense vs indices labels')
+    sub.add_argument('--num-classes', type=int, default=10000)
+    sub.add_argument('--labels-per-sample', type=int, default=5)
+    sub.add_argument('--batch-size', '-b', type=int, default=256)
+    sub.add_argument('--num-batches', type=int, default=20)
+    sub = subparsers.add_parser('decode', help='image decode with and without a JPEG draft')
+    sub.add_argument('imglist')
+    sub.add_argument('root')
+    sub.add_argument('--decode-max-size', type=int, default=256)
+    sub.add_argument('--num-samples', '-n', type=int, default=256)
+    opt = parser.parse_args()
+    if opt.bench == 'read_many':
+        result = bench_read_many(opt.num_paths, opt.latency, opt.size, opt.max_workers, opt.repeat)
+    elif opt.bench == 'lmdb':
+        result = bench_lmdb(opt.lmdb_path, opt.num_keys, opt.batch_size, opt.repeat, opt.seed)
+    elif opt.bench == 'imglist_memory':
+        result = bench_imglist_memory(opt.num_items, opt.num_workers)
+    elif opt.bench == 'label_format':
+        result = bench_label_format(opt.num_classes, opt.labels_per_sample, opt.batch_size, opt.num_batches)
+    elif opt.bench == 'decode':
+        result = bench_decode(opt.imglist, opt.root, opt.decode_max_size, opt.num_samples)
+    print(json.dumps(result, indent=2), flush=True)
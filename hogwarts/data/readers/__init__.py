@@ -1,6 +1,9 @@
 from .direct_reader import *
+from .prefetch_reader import *
+from .cached_reader import *
+from .shard_reader import *
+from .ceph_reader import *
 try:
     from .lmdb_reader import *
-    from .ceph_reader import *
 except Exception:
     pass
@@ -0,0 +1,220 @@
+__all__ = ['CachedReader']
+
+
+import os
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+
+
+class _FileTier:
+
+    def __init__(self, root, capacity, policy, low_watermark=0.9, flush_every=1024, flush_interval=5):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError('policy should be one of lru / lfu, but got {}'.format(policy))
+        self.root = Path(root)
+        self.capacity = capacity
+        self.policy = policy
+        self.low_watermark = low_watermark
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._root = str(self.root)
+        self._connect()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_db', '_pid', '_accesses', '_hits', '_misses', '_last_flush'):
+            state.pop(key, None)
+        return state
+
+    def _connect(self):
+        # sqlite connections must not cross fork, so each process opens its own;
+        # the index file itself is shared by every process on the node
+        if getattr(self, '_pid', None) == os.getpid():
+            return self._db
+        db = sqlite3.connect(str(self.root / 'index.sqlite'), timeout=600, isolation_level=None)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=OFF')
+        db.execute('CREATE TABLE IF NOT EXISTS entries '
+                   '(key TEXT PRIMARY KEY, size INTEGER, atime INTEGER, hits INTEGER)')
+        db.execute('CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)')
+        db.execute('CREATE INDEX IF NOT EXISTS entries_hits ON entries (hits, atime)')
+        db.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)')
+        for name in ('hits', 'misses', 'evictions', 'bytes'):
+            db.execute('INSERT OR IGNORE INTO counters VALUES (?, 0)', (name,))
+        self._db = db
+        self._pid = os.getpid()
+        # lookups only touch the index in batches: the accesses of this
+        # process since the last flush, key -> [atime, hits]
+        self._accesses = {}
+        self._hits = self._misses = 0
+        self._last_flush = time.monotonic()
+        return db
+
+    def _file(self, key):
+        # plain string joins, pathlib costs more than the read itself on a hit
+        digest = hashlib.sha1(key.encode('utf8')).hexdigest()
+        return os.path.join(self._root, digest[:2], digest)
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _count(self, db, name, delta=1):
+        db.execute('UPDATE counters SET value = value + ? WHERE name = ?', (delta, name))
+
+    def get(self, key):
+        # no lock on the way: the entry file is read directly, and the access
+        # is only noted here until the next flush
+        try:
+            with open(self._file(key), 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = None
+        self._connect()
+        if content is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+            access = self._accesses.setdefault(key, [0, 0])
+            access[0] = time.time_ns()
+            access[1] += 1
+        if (len(self._accesses) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            with self._transaction() as db:
+                self._flush(db)
+        return content
+
+    def _flush(self, db):
+        # a process that exits between flushes loses its last accesses, which
+        # only makes eviction order and stats slightly stale
+        db.executemany('UPDATE entries SET atime = MAX(atime, ?), hits = hits + ? WHERE key = ?',
+                       [(atime, hits, key) for key, (atime, hits) in self._accesses.items()])
+        self._count(db, 'hits', self._hits)
+        self._count(db, 'misses', self._misses)
+        self._accesses = {}
+        self._hits = self._misses = 0
+        self._last_flush = time.monotonic()
+
+    def put(self, key, content):
+        size = len(content)
+        if size > self.capacity:
+            return
+        fpath = self._file(key)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        tmp_fpath = '{}.{}.tmp'.format(fpath, os.getpid())
+        with open(tmp_fpath, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_fpath, fpath)
+
+        with self._transaction() as db:
+            # eviction should see this process's recent accesses
+            self._flush(db)
+            row = db.execute('SELECT size, hits FROM entries WHERE key = ?', (key,)).fetchone()
+            old_size, hits = (0, 0) if row is None else row
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                       (key, size, time.time_ns(), hits))
+            self._count(db, 'bytes', size - old_size)
+            total = db.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+            if total > self.capacity:
+                self._evict(db, total - int(self.capacity * self.low_watermark), key)
+
+    def _evict(self, db, num_bytes, keep_key):
+        order = 'atime' if self.policy == 'lru' else 'hits, atime'
+        victims = []
+        freed = 0
+        query = 'SELECT key, size FROM entries WHERE key != ? ORDER BY {}'.format(order)
+        for key, size in db.execute(query, (keep_key,)):
+            victims.append(key)
+            freed += size
+            if freed >= num_bytes:
+                break
+        db.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in victims])
+        self._count(db, 'bytes', -freed)
+        self._count(db, 'evictions', len(victims))
+        # readers that already opened a victim keep reading it after unlink
+        for key in victims:
+            try:
+                os.unlink(self._file(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._transaction() as db:
+            self._flush(db)
+        stats = dict(db.execute('SELECT name, value FROM counters'))
+        stats['entries'] = db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        stats['capacity'] = self.capacity
+        return stats
+
+
+def _describe(reader):
+    # the reader's class and plain settings (lmdb path, shard dir, ...),
+    # down through wrapped readers
+    parts = []
+    for name, value in sorted(vars(reader).items()):
+        if name.startswith('_'):
+            continue
+        if name == 'reader':
+            parts.append('reader={}'.format(_describe(value)))
+        elif value is None or isinstance(value, (str, int, float, bool, Path)):
+            parts.append('{}={}'.format(name, value))
+    return '{}({})'.format(type(reader).__name__, ', '.join(parts))
+
+
+def _reader_identity(reader):
+    # plus the working directory relative paths resolve against; readers
+    # that agree on it read the same bytes for a key
+    return '{}:{}'.format(os.getcwd(), _describe(reader))
+
+
+class CachedReader:
+    # each tier lives in a subdirectory of its dir named after the wrapped
+    # reader (or namespace, if given), so caches of different sources on a
+    # node never serve each other's bytes or share a capacity
+
+    def __init__(self, reader, mem_capacity=0, disk_capacity=0,
+                 mem_dir='/dev/shm/hogwarts_cache', disk_dir=None,
+                 mem_policy='lru', disk_policy='lru', namespace=None):
+        if disk_capacity > 0 and disk_dir is None:
+            raise ValueError('if disk_capacity > 0, should provide disk_dir')
+        self.reader = reader
+        if namespace is None:
+            namespace = _reader_identity(reader)
+        self.namespace = namespace
+        subdir = hashlib.sha1(namespace.encode('utf8')).hexdigest()[:16]
+        # the memory tier lives on tmpfs, so all workers on a node share it
+        self.tiers = []
+        if mem_capacity > 0:
+            self.tiers.append(('memory', _FileTier(os.path.join(mem_dir, subdir), mem_capacity, mem_policy)))
+        if disk_capacity > 0:
+            self.tiers.append(('disk', _FileTier(os.path.join(disk_dir, subdir), disk_capacity, disk_policy)))
+
+    def __call__(self, path):
+        for level, (_, tier) in enumerate(self.tiers):
+            content = tier.get(path)
+            if content is not None:
+                # promote into the faster tiers that missed
+                for _, upper_tier in self.tiers[:level]:
+                    upper_tier.put(path, content)
+                return content
+
+        content = self.reader(path)
+        if content is None:
+            return content
+        for _, tier in self.tiers:
+            tier.put(path, content)
+        return content
+
+    def stats(self):
+        return {name: tier.stats() for name, tier in self.tiers}
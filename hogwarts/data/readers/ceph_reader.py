@@ -1,16 +1,80 @@
 __all__ = ['CephReader']
 
 
-import ceph
-import glog
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 
-glog.setLevel(glog.logging.ERROR)
+class _ClientPool:
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def client(self):
+        try:
+            client = self.idle.get_nowait()
+        except queue.Empty:
+            client = self.factory()
+        try:
+            yield client
+        finally:
+            self.idle.put(client)
 
 
 class CephReader:
 
+    def __init__(self, max_workers=16, client_factory=None):
+        if max_workers < 1:
+            raise ValueError('max_workers should be >= 1, but got {}'.format(max_workers))
+        self.max_workers = max_workers
+        self.client_factory = client_factory
+
+    def __getstate__(self):
+        # clients and threads never cross process boundaries
+        state = self.__dict__.copy()
+        state.pop('_pool', None)
+        state.pop('_executor', None)
+        return state
+
+    def _get_pool(self):
+        # a forked DataLoader worker inherits the parent's pool, whose clients
+        # hold connections that must not be shared, so rebuild it per process
+        pool = getattr(self, '_pool', None)
+        if pool is None or pool.pid != os.getpid():
+            factory = self.client_factory
+            if factory is None:
+                # the SDK is only needed without a client_factory, e.g. not
+                # for a fake client
+                import ceph
+                import glog
+                glog.setLevel(glog.logging.ERROR)
+                factory = ceph.S3Client
+            pool = self._pool = _ClientPool(factory)
+            self._executor = None
+        return pool
+
+    def _get_executor(self):
+        pool = self._get_pool()
+        with pool.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers)
+        return self._executor
+
     def __call__(self, path):
-        s3client = ceph.S3Client()
-        content = s3client.Get(path)
+        with self._get_pool().client() as s3client:
+            content = s3client.Get(path)
         return content
+
+    def read_many(self, paths):
+        # at most max_workers GETs are in flight, each on its own pooled client
+        paths = list(paths)
+        if len(paths) <= 1:
+            return [self(path) for path in paths]
+        return list(self._get_executor().map(self, paths))
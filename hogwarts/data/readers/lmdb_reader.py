@@ -1,31 +1,79 @@
 __all__ = ['LMDBReader']
 
 
+import os
+import threading
 import lmdb
 
 
-class LMDBReader:
-
-    def __init__(self, lmdb_path, coding='utf8'):
-        self.lmdb_path = lmdb_path
-        self.coding = coding
+_envs = {}
+_envs_pid = None
+_envs_lock = threading.Lock()
 
-    def __del__(self):
-        if hasattr(self, 'env'):
-            self.env.close()
 
-    def __call__(self, path):
-        if not hasattr(self, 'env'):
-            self.env = lmdb.open(
-                self.lmdb_path,
+def _open_env(lmdb_path):
+    # lmdb refuses to open one env twice in a process, and an env inherited
+    # through fork (e.g. by DataLoader workers) must not be used, so envs are
+    # shared by all readers of a process, and inherited ones are closed and
+    # reopened after fork
+    global _envs, _envs_pid
+    with _envs_lock:
+        if _envs_pid != os.getpid():
+            for env in _envs.values():
+                env.close()
+            _envs, _envs_pid = {}, os.getpid()
+        if lmdb_path not in _envs:
+            env = lmdb.open(
+                lmdb_path,
                 readonly=True,
                 lock=False,
                 readahead=False,
                 meminit=False,
             )
-            if not self.env:
-                raise Exception('cannot open lmdb from %s' % (self.lmdb_path))
+            if not env:
+                raise Exception('cannot open lmdb from %s' % (lmdb_path))
+            _envs[lmdb_path] = env
+        return _envs[lmdb_path]
+
+
+class LMDBReader:
 
-        with self.env.begin(write=False) as txn:
-            value = txn.get(path.encode(self.coding))
+    def __init__(self, lmdb_path, coding='utf8', buffers=False):
+        self.lmdb_path = lmdb_path
+        self.coding = coding
+        # if buffers is True, values are memoryviews into the mmap, valid for
+        # the lifetime of the reader rather than fresh bytes objects
+        self.buffers = buffers
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('env', '_pid', '_local'):
+            state.pop(key, None)
+        return state
+
+    def _get_txn(self):
+        if getattr(self, '_pid', None) != os.getpid():
+            self.env = _open_env(self.lmdb_path)
+            self._pid = os.getpid()
+            self._local = threading.local()
+
+        # read-only transactions are reused, one per thread
+        txn = getattr(self._local, 'txn', None)
+        if txn is None:
+            txn = self._local.txn = self.env.begin(write=False, buffers=self.buffers)
+        return txn
+
+    def __call__(self, path):
+        value = self._get_txn().get(path.encode(self.coding))
         return value
+
+    def get_many(self, keys):
+        txn = self._get_txn()
+        keys = [key.encode(self.coding) for key in keys]
+        values = [None] * len(keys)
+        # visit keys in sorted order so the cursor walks the B-tree forward
+        with txn.cursor() as cursor:
+            for index in sorted(range(len(keys)), key=keys.__getitem__):
+                if cursor.set_key(keys[index]):
+                    values[index] = cursor.value()
+        return values
@@ -0,0 +1,113 @@
+__all__ = ['PrefetchReader']
+
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PrefetchReader:
+
+    def __init__(self, reader, depth=64, max_bytes=256 << 20, num_threads=8):
+        if depth < 1:
+            raise ValueError('depth should be >= 1, but got {}'.format(depth))
+        if num_threads < 1:
+            raise ValueError('num_threads should be >= 1, but got {}'.format(num_threads))
+        self.reader = reader
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.num_threads = num_threads
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_pid', '_cond', '_buffer', '_bytes', '_generation', '_executor'):
+            state.pop(key, None)
+        return state
+
+    def _init_process(self):
+        # threads do not survive fork, so every process owns a fresh buffer
+        if getattr(self, '_pid', None) == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.RLock())
+        self._buffer = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._executor = ThreadPoolExecutor(self.num_threads)
+
+    def schedule(self, paths):
+        # paths is consumed lazily, so it may be an endless sampler-driven stream
+        self._init_process()
+        with self._cond:
+            self._generation += 1
+            while self._buffer:
+                self._discard(self._buffer.popitem(last=False)[1])
+            self._cond.notify_all()
+        feeder = threading.Thread(target=self._feed, args=(iter(paths), self._generation), daemon=True)
+        feeder.start()
+
+    def close(self):
+        if getattr(self, '_pid', None) != os.getpid():
+            return
+        with self._cond:
+            self._generation += 1
+            while self._buffer:
+                self._discard(self._buffer.popitem(last=False)[1])
+            self._cond.notify_all()
+        self._executor.shutdown(wait=False)
+        del self._pid
+
+    def __call__(self, path):
+        self._init_process()
+        future = None
+        with self._cond:
+            if path in self._buffer:
+                # the consumer has moved past anything scheduled before this path
+                while True:
+                    buffered_path, future = self._buffer.popitem(last=False)
+                    if buffered_path == path:
+                        break
+                    self._discard(future)
+                self._cond.notify_all()
+        if future is None:
+            return self.reader(path)
+        content = future.result()
+        with self._cond:
+            self._bytes -= len(content)
+            self._cond.notify_all()
+        return content
+
+    def _full(self):
+        return len(self._buffer) >= self.depth or self._bytes >= self.max_bytes
+
+    def _feed(self, paths, generation):
+        try:
+            for path in paths:
+                with self._cond:
+                    while self._full() and self._generation == generation:
+                        self._cond.wait()
+                    if self._generation != generation:
+                        return
+                    if path not in self._buffer:
+                        self._buffer[path] = self._executor.submit(self._fetch, path)
+        except Exception:
+            logging.exception('prefetch stream stopped')
+
+    def _fetch(self, path):
+        content = self.reader(path)
+        with self._cond:
+            self._bytes += len(content)
+        return content
+
+    def _discard(self, future):
+        future.cancel()
+        future.add_done_callback(self._release)
+
+    def _release(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._cond:
+            self._bytes -= len(future.result())
+            self._cond.notify_all()
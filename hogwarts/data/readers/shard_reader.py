@@ -0,0 +1,168 @@
+__all__ = ['ShardReader', 'pack_shards']
+
+
+import os
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from multiprocessing import Pool
+from .direct_reader import DirectReader
+
+
+# index.bin layout (native byte order):
+#   header                 <8s Q Q>   magic, num_items, num_shards
+#   shard_ids   [n]        u64
+#   offsets     [n]        u64       byte offset inside the shard
+#   lengths     [n]        u64
+#   name_offsets [n + 1]   u64       into the name blob
+#   name_order  [n]        u64       item indices sorted by name
+#   name blob              utf8
+_MAGIC = b'HGWSHRD1'
+_HEADER = struct.Struct('<8sQQ')
+
+
+def _shard_name(shard_id):
+    return 'shard-{:05d}.bin'.format(shard_id)
+
+
+def _read_imglist_names(imglist):
+    names = []
+    with open(imglist) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                names.append(line.split(maxsplit=1)[0])
+    return names
+
+
+def _pack_shard(args):
+    shard_path, names, root, reader = args
+    lengths = []
+    with open(shard_path, 'wb') as f:
+        for name in names:
+            content = reader(os.path.join(root, name))
+            f.write(content)
+            lengths.append(len(content))
+    return lengths
+
+
+def pack_shards(imglist, root, out_dir, items_per_shard=10000, num_workers=None, reader=None):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if reader is None:
+        reader = DirectReader()
+    names = _read_imglist_names(imglist)
+    num_items = len(names)
+    num_shards = (num_items + items_per_shard - 1) // items_per_shard
+
+    # one task per shard, items stay in imglist order so that sequential
+    # sampling turns into sequential reads
+    tasks = []
+    for shard_id in range(num_shards):
+        chunk = names[shard_id * items_per_shard : (shard_id + 1) * items_per_shard]
+        tasks.append((str(out_dir / _shard_name(shard_id)), chunk, root, reader))
+    with Pool(num_workers) as pool:
+        shard_lengths = pool.map(_pack_shard, tasks, chunksize=1)
+
+    shard_ids, offsets, lengths = array('Q'), array('Q'), array('Q')
+    for shard_id, chunk_lengths in enumerate(shard_lengths):
+        offset = 0
+        for length in chunk_lengths:
+            shard_ids.append(shard_id)
+            offsets.append(offset)
+            lengths.append(length)
+            offset += length
+
+    encoded = [name.encode('utf8') for name in names]
+    name_offsets = array('Q', [0])
+    for name in encoded:
+        name_offsets.append(name_offsets[-1] + len(name))
+    name_order = array('Q', sorted(range(num_items), key=encoded.__getitem__))
+
+    index_path = out_dir / 'index.bin'
+    with open(str(index_path) + '.tmp', 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, num_items, num_shards))
+        for arr in (shard_ids, offsets, lengths, name_offsets, name_order):
+            arr.tofile(f)
+        f.write(b''.join(encoded))
+    os.replace(str(index_path) + '.tmp', str(index_path))
+    return num_items, num_shards
+
+
+class ShardReader:
+
+    def __init__(self, shard_dir, root=''):
+        self.shard_dir = Path(shard_dir)
+        # dataset paths are os.path.join(root, name), the index holds names
+        self.root = root
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_index', '_shards', 'num_items', '_arrays', '_names'):
+            state.pop(key, None)
+        return state
+
+    def _open(self):
+        if hasattr(self, '_index'):
+            return
+        with open(str(self.shard_dir / 'index.bin'), 'rb') as f:
+            index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_items, num_shards = _HEADER.unpack_from(index)
+        if magic != _MAGIC:
+            raise RuntimeError('{} is not a hogwarts shard index'.format(self.shard_dir / 'index.bin'))
+
+        view = memoryview(index)
+        arrays = []
+        start = _HEADER.size
+        for length in (num_items, num_items, num_items, num_items + 1, num_items):
+            arrays.append(view[start : start + length * 8].cast('Q'))
+            start += length * 8
+        self._arrays = arrays
+        self._names = view[start:]
+        self._index = index
+        self._shards = [None] * num_shards
+        self.num_items = num_items
+
+    def __len__(self):
+        self._open()
+        return self.num_items
+
+    def _shard(self, shard_id):
+        shard = self._shards[shard_id]
+        if shard is None:
+            with open(str(self.shard_dir / _shard_name(shard_id)), 'rb') as f:
+                shard = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._shards[shard_id] = shard
+        return shard
+
+    def _name(self, index):
+        name_offsets = self._arrays[3]
+        return self._names[name_offsets[index] : name_offsets[index + 1]]
+
+    def lookup(self, name):
+        self._open()
+        key = name.encode('utf8')
+        name_order = self._arrays[4]
+        lo, hi = 0, self.num_items
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(name_order[mid]).tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.num_items or self._name(name_order[lo]).tobytes() != key:
+            raise KeyError('{} not found in {}'.format(name, self.shard_dir))
+        return name_order[lo]
+
+    def read_index(self, index):
+        self._open()
+        shard_ids, offsets, lengths = self._arrays[:3]
+        offset = offsets[index]
+        # zero-copy view into the page cache
+        return memoryview(self._shard(shard_ids[index]))[offset : offset + lengths[index]]
+
+    def __call__(self, path):
+        if self.root != '':
+            path = os.path.relpath(path, self.root)
+        return self.read_index(self.lookup(path))
@@ -1 +1,6 @@
 from .distributed_sampler import *
+from .worker_stream import *
+from .permutation import *
+from .block_sampler import *
+from .weighted_sampler import *
+from .aspect_ratio_sampler import *
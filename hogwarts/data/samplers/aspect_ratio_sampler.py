@@ -0,0 +1,102 @@
+__all__ = ['AspectRatioBatchSampler']
+
+import math
+import random
+import numpy as np
+import torch
+from torch.utils.data.sampler import Sampler
+from ... import distributed as dist
+from ..scan import SCAN_PENDING, SCAN_UNREADABLE, SCAN_UNDECODABLE, load_scan
+
+
+class AspectRatioBatchSampler(Sampler):
+    # batches only ever mix images of one bucket, by aspect ratio
+    # (width / height) or by area, read from the sidecar written by hscan;
+    # images the scan found broken are left out. Pass it to DataLoader as
+    # batch_sampler
+
+    def __init__(self, dataset, scan, batch_size, key='aspect', boundaries=(0.5, 0.8, 1.25, 2.0),
+                 shuffle=True, pseudo_index=None, seed=0):
+        if key not in ('aspect', 'area'):
+            raise ValueError('key not one of ["aspect", "area"]')
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pseudo_index = pseudo_index
+        self.seed = seed
+
+        self.world_size = dist.get_world_size()
+        self.rank = dist.get_rank()
+
+        records = load_scan(scan) if isinstance(scan, str) else scan
+        if len(records) < len(dataset):
+            raise ValueError('scan has {} records, but dataset has {} images'.format(len(records), len(dataset)))
+        records = records[:len(dataset)]
+        # an interrupted hscan leaves records pending, whose sizes are unknown
+        num_pending = int(np.count_nonzero(records['status'] == SCAN_PENDING))
+        if num_pending > 0:
+            raise ValueError('{} of {} images are not scanned yet, rerun hscan to finish the scan'.format(
+                num_pending, len(records)))
+        broken = np.isin(records['status'], (SCAN_UNREADABLE, SCAN_UNDECODABLE))
+        valid = torch.from_numpy(np.flatnonzero(~broken))
+        width = torch.from_numpy(records['width'].astype(np.float64))[valid]
+        height = torch.from_numpy(records['height'].astype(np.float64))[valid]
+        values = width / height if key == 'aspect' else width * height
+        buckets = torch.bucketize(values, torch.tensor(boundaries, dtype=torch.float64))
+
+        # indices grouped by bucket, and the bucket sizes padded to whole batches
+        self.buckets, order = buckets.sort(stable=True)
+        self.indices = valid[order]
+        self.counts = torch.bincount(self.buckets, minlength=len(boundaries) + 1)
+        self.padded_counts = (self.counts + batch_size - 1) // batch_size * batch_size
+        num_batches = int(self.padded_counts.sum()) // batch_size
+        self.num_batches = int(math.ceil(num_batches / self.world_size))
+
+        self.epoch = 0
+        self.auto_epoch = True
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        self.auto_epoch = False
+
+    def __iter__(self):
+        epoch = self.epoch
+        if self.auto_epoch:
+            self.epoch += 1
+        generator = torch.Generator()
+        generator.manual_seed(random.Random('{}-{}'.format(self.seed, epoch)).getrandbits(63))
+
+        indices = self.indices
+        if self.shuffle:
+            # shuffle, then stable-sort back into buckets: random within each bucket
+            perm = torch.randperm(len(indices), generator=generator)
+            order = self.buckets[perm].sort(stable=True)[1]
+            indices = indices[perm[order]]
+
+        # slot r of bucket b takes the r-th index of the bucket, and slots
+        # past the bucket's end are pseudo ones or wrap to its head
+        starts = self.counts.cumsum(0) - self.counts
+        padded_starts = self.padded_counts.cumsum(0) - self.padded_counts
+        slot_buckets = torch.repeat_interleave(torch.arange(len(self.counts)), self.padded_counts)
+        slots = torch.arange(len(slot_buckets)) - padded_starts[slot_buckets]
+        counts = self.counts[slot_buckets]
+        batches = indices[starts[slot_buckets] + slots % counts]
+        if self.pseudo_index is not None:
+            batches[slots >= counts] = self.pseudo_index
+        batches = batches.view(-1, self.batch_size)
+        if self.shuffle:
+            batches = batches[torch.randperm(len(batches), generator=generator)]
+
+        # whole extra batches make it evenly divisible over ranks
+        num_extra = self.num_batches * self.world_size - len(batches)
+        if num_extra > 0:
+            if self.pseudo_index is None:
+                extra = batches[torch.arange(num_extra) % len(batches)]
+            else:
+                extra = torch.full((num_extra, self.batch_size), self.pseudo_index, dtype=torch.int64)
+            batches = torch.cat([batches, extra])
+        for batch in batches[self.rank::self.world_size].tolist():
+            yield batch
+
+    def __len__(self):
+        return self.num_batches
@@ -0,0 +1,63 @@
+__all__ = ['BlockDistributedSampler']
+
+import math
+from .distributed_sampler import DistributedSampler
+from .permutation import LazyPermutation
+
+
+class BlockDistributedSampler(DistributedSampler):
+    # shuffles blocks of block_size consecutive indices, then the samples
+    # within each window of window_blocks blocks, so reads stay within a few
+    # sequential runs at any time; a partial last block stays last
+
+    def __init__(self, dataset, block_size=256, window_blocks=16, pseudo_index=None, seed=0,
+                 chunk_size=65536):
+        if block_size < 1:
+            raise ValueError('block_size should be >= 1, but got {}'.format(block_size))
+        if window_blocks < 1:
+            raise ValueError('window_blocks should be >= 1, but got {}'.format(window_blocks))
+        super(BlockDistributedSampler, self).__init__(dataset, shuffle=True, pseudo_index=pseudo_index,
+                                                      seed=seed, chunk_size=chunk_size)
+        self.block_size = block_size
+        self.window_blocks = window_blocks
+
+    def _layout(self):
+        size = len(self.dataset)
+        span = self.block_size * self.window_blocks
+        num_full_blocks = size // self.block_size
+        num_windows = max(int(math.ceil(size / span)), 1)
+        last_size = size - (num_windows - 1) * span
+        return span, num_full_blocks, num_windows, last_size
+
+    def _order(self, epoch):
+        span, num_full_blocks, num_windows, last_size = self._layout()
+        seed = '{}-{}'.format(self.seed, epoch)
+        blocks = LazyPermutation(num_full_blocks, seed + '-blocks')
+        window = LazyPermutation(span, seed + '-window')
+        last_window = LazyPermutation(last_size, seed + '-last')
+
+        def order(positions):
+            windows = positions // span
+            slots = positions - windows * span
+            # every window draws its own permutation, the last one may be short
+            in_last = windows == num_windows - 1
+            slots[~in_last] = window(slots[~in_last], windows[~in_last])
+            slots[in_last] = last_window(slots[in_last])
+            block_slots = windows * self.window_blocks + slots // self.block_size
+            offsets = slots % self.block_size
+            full = block_slots < num_full_blocks
+            block_slots[full] = blocks(block_slots[full])
+            return block_slots * self.block_size + offsets
+
+        return order
+
+    def randomness(self):
+        # log of the number of orders this sampler can produce relative to
+        # log N!, the same for a full shuffle: 1 means full shuffle, 0 none
+        size = len(self.dataset)
+        if size < 2:
+            return 1.0
+        span, num_full_blocks, num_windows, last_size = self._layout()
+        log_orders = math.lgamma(num_full_blocks + 1)
+        log_orders += (num_windows - 1) * math.lgamma(span + 1) + math.lgamma(last_size + 1)
+        return log_orders / math.lgamma(size + 1)
@@ -4,53 +4,113 @@ import math
 import torch
 from torch.utils.data.sampler import Sampler
 from ... import distributed as dist
+from .permutation import LazyPermutation
 
 
 class DistributedSampler(Sampler):
 
-    def __init__(self, dataset, shuffle=False, pseudo_index=None):
+    def __init__(self, dataset, shuffle=False, pseudo_index=None, seed=0, chunk_size=65536):
         self.dataset = dataset
         self.shuffle = shuffle
         self.pseudo_index = pseudo_index
+        self.seed = seed
+        self.chunk_size = chunk_size
 
         self.world_size = dist.get_world_size()
         self.rank = dist.get_rank()
-        self.num_samples = int(math.ceil(len(self.dataset) / self.world_size))
+        # the length of one epoch's order, before padding
+        self.size = len(self.dataset)
+        self.num_samples = int(math.ceil(self.size / self.world_size))
         self.total_size = self.num_samples * self.world_size
 
-        if self.shuffle:
-            self.g = torch.Generator()
-            state = torch.get_rng_state()
-            # synchronize local random state
-            backend = dist.get_backend()
-            if backend != 'nccl':
-                raise RuntimeError('only support nccl backend currently')
-            state = state.cuda()
-            dist.broadcast([state], 0)
-            state = state.cpu()
-            self.g.set_state(state)
+        # every rank derives the same order from (seed, epoch), so nothing is
+        # synchronized; without set_epoch, each pass moves to the next epoch
+        self.epoch = 0
+        self.auto_epoch = True
+
+        # progress of the current pass, and where a loaded state resumes it
+        self.iter_epoch = None
+        self.yielded = 0
+        self.resume_from = 0
+        self.anchor = 0
+
+    def set_epoch(self, epoch):
+        if epoch != self.epoch:
+            self.resume_from = 0
+        self.epoch = epoch
+        self.auto_epoch = False
 
     def __iter__(self):
-        if self.shuffle:
-            # shuffle based on (already synchronized) local random generator
-            indices = list(torch.randperm(len(self.dataset), generator=self.g))
-        else:
-            indices = list(range(len(self.dataset)))
+        epoch, consumed = self.epoch, self.resume_from
+        self.resume_from = 0
+        if self.auto_epoch:
+            self.epoch += 1
+        self.iter_epoch, self.yielded = epoch, consumed
+        # any position of the order is computed directly, so resuming skips
+        # the consumed samples without walking them
+        offset = self.num_samples * self.rank
+        return self._iter_positions(epoch, offset + consumed, offset + self.num_samples)
 
-        # add extra samples to make it evenly divisible
-        num_extra = self.total_size - len(indices)
-        if self.pseudo_index is None:
-            indices += indices[:num_extra]
+    def state_dict(self, consumed=None, anchor=0):
+        # consumed is how many samples of the current epoch this rank has
+        # trained on; it defaults to the number yielded so far, which runs
+        # ahead by whatever the DataLoader has prefetched. anchor is the
+        # progress value last passed to hogwarts.utils.tensorboard.checkpoint,
+        # 0 for none, so a resumed job can call tensorboard.init(log_dir,
+        # sampler.anchor) once it has loaded the state
+        if self.iter_epoch is None:
+            epoch, yielded = self.epoch, self.resume_from
         else:
-            indices += [self.pseudo_index] * num_extra
-        assert len(indices) == self.total_size
+            epoch, yielded = self.iter_epoch, self.yielded
+        return {
+            'seed': self.seed,
+            'epoch': epoch,
+            'auto_epoch': self.auto_epoch,
+            'consumed': yielded if consumed is None else consumed,
+            'num_samples': self.num_samples,
+            'world_size': self.world_size,
+            'anchor': anchor,
+        }
 
-        # subsample
-        offset = self.num_samples * self.rank
-        indices = indices[offset : offset + self.num_samples]
-        assert len(indices) == self.num_samples
+    def load_state_dict(self, state):
+        if state['world_size'] != self.world_size or state['num_samples'] != self.num_samples:
+            raise ValueError('cannot resume a sampler state of {} x {} samples with {} x {} samples'.format(
+                state['world_size'], state['num_samples'], self.world_size, self.num_samples))
+        self.seed = state['seed']
+        self.auto_epoch = state['auto_epoch']
+        self.epoch, self.resume_from = state['epoch'], state['consumed']
+        if self.resume_from >= self.num_samples:
+            self.epoch, self.resume_from = self.epoch + 1, 0
+        self.iter_epoch = None
+        # states saved without an anchor hold None
+        self.anchor = state['anchor'] or 0
+
+    def _iter_positions(self, epoch, start, stop):
+        # the epoch order is [order(0), ..., order(N - 1)] padded to total_size,
+        # and this rank takes positions [start, stop) of it, a chunk at a time
+        size = self.size
+        order = self._order(epoch)
+        for chunk_start in range(start, stop, self.chunk_size):
+            positions = torch.arange(chunk_start, min(chunk_start + self.chunk_size, stop))
+            # extra samples make it evenly divisible, either pseudo ones or
+            # the head of the order again
+            padding = positions >= size
+            if self.pseudo_index is None:
+                positions.remainder_(size)
+            else:
+                positions[padding] = 0
+            indices = order(positions)
+            if self.pseudo_index is not None:
+                indices[padding] = self.pseudo_index
+            for index in indices.tolist():
+                self.yielded += 1
+                yield index
 
-        return iter(indices)
+    def _order(self, epoch):
+        # maps int64 positions in range(size) to dataset indices
+        if not self.shuffle:
+            return lambda positions: positions
+        return LazyPermutation(self.size, '{}-{}'.format(self.seed, epoch))
 
     def __len__(self):
-        return self.num_samples
+        return self.num_samples - self.resume_from
@@ -0,0 +1,56 @@
+__all__ = ['LazyPermutation']
+
+import random
+
+
+_MASK32 = 0xFFFFFFFF
+
+
+def _mix(x, key):
+    # 32-bit integer hash, in place on a fresh tensor; int64 products may
+    # wrap, but masking keeps the low 32 bits exact
+    x = x ^ key
+    x.mul_(0x9E3779B1).bitwise_and_(_MASK32)
+    x.bitwise_xor_(x >> 15)
+    x.mul_(0x85EBCA6B).bitwise_and_(_MASK32)
+    x.bitwise_xor_(x >> 13)
+    return x
+
+
+class LazyPermutation:
+    # a seeded bijection of range(n), evaluated only at the positions asked
+    # for: a balanced Feistel network over the smallest even bit width that
+    # covers n, cycle-walked back into range(n)
+
+    def __init__(self, n, seed, num_rounds=4):
+        if n < 0 or n >= 1 << 62:
+            raise ValueError('n should be in [0, 2 ** 62), but got {}'.format(n))
+        self.n = n
+        self.half_bits = max((max(n - 1, 1).bit_length() + 1) // 2, 1)
+        self.half_mask = (1 << self.half_bits) - 1
+        rng = random.Random(seed)
+        self.keys = [rng.getrandbits(32) for _ in range(num_rounds)]
+
+    def __len__(self):
+        return self.n
+
+    def _encrypt(self, x, tweaks):
+        left, right = x >> self.half_bits, x & self.half_mask
+        for key in self.keys:
+            key = key if tweaks is None else tweaks ^ key
+            left, right = right, _mix(right, key).bitwise_and_(self.half_mask).bitwise_xor_(left)
+        return (left << self.half_bits).bitwise_or_(right)
+
+    def __call__(self, positions, tweaks=None):
+        # positions: int64 tensor of values in range(n); tweaks, if given, is
+        # an int64 tensor alongside it choosing one of many independent
+        # permutations for each position
+        if tweaks is not None:
+            tweaks = _mix(tweaks, self.keys[0])
+        out = self._encrypt(positions, tweaks)
+        # the domain is less than 4n, so only a few passes are ever needed
+        outside = (out >= self.n).nonzero().squeeze(1)
+        while len(outside):
+            out[outside] = self._encrypt(out[outside], None if tweaks is None else tweaks[outside])
+            outside = outside[out[outside] >= self.n]
+        return out
@@ -0,0 +1,61 @@
+__all__ = ['WeightedDistributedSampler', 'class_balanced_weights']
+
+import math
+import random
+import numpy as np
+import torch
+from .distributed_sampler import DistributedSampler
+
+
+def class_balanced_weights(labels, power=1.0):
+    # per-item weights making every class equally likely, given e.g.
+    # SingleLabelDataset.imglist.labels; power < 1 balances only partly
+    # (0.5 draws classes in proportion to the square root of their size)
+    labels = np.asarray(labels, dtype=np.int64)
+    counts = np.bincount(labels).astype(np.float64)
+    counts[counts == 0] = 1
+    return counts[labels] ** -power
+
+
+class WeightedDistributedSampler(DistributedSampler):
+    # draws num_draws indices per epoch (len(dataset) by default) with
+    # replacement, with probability proportional to weights; every draw is
+    # fixed by (seed, epoch, position), so ranks need no synchronization and
+    # mid-epoch resume works as in DistributedSampler
+
+    def __init__(self, dataset, weights, num_draws=None, pseudo_index=None, seed=0, chunk_size=65536):
+        super(WeightedDistributedSampler, self).__init__(dataset, shuffle=True, pseudo_index=pseudo_index,
+                                                         seed=seed, chunk_size=chunk_size)
+        weights = torch.as_tensor(np.asarray(weights, dtype=np.float64))
+        if weights.dim() != 1 or len(weights) != len(dataset):
+            raise ValueError('weights should be 1-d of length {}, but got shape {}'.format(
+                len(dataset), tuple(weights.size())))
+        if (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError('weights should be non-negative and not all zero')
+        self.cdf = weights.cumsum(0)
+
+        self.size = len(dataset) if num_draws is None else num_draws
+        self.num_samples = int(math.ceil(self.size / self.world_size))
+        self.total_size = self.num_samples * self.world_size
+
+    def _order(self, epoch):
+        total = self.cdf[-1].item()
+
+        def order(positions):
+            # uniforms come in fixed blocks of chunk_size draws, so a draw
+            # does not depend on which rank or chunk asks for it
+            blocks = positions // self.chunk_size
+            uniforms = torch.empty(len(positions), dtype=torch.float64)
+            for block in torch.unique(blocks).tolist():
+                generator = torch.Generator()
+                generator.manual_seed(random.Random('{}-{}-{}'.format(self.seed, epoch, block)).getrandbits(63))
+                draws = torch.rand(self.chunk_size, generator=generator, dtype=torch.float64)
+                mask = blocks == block
+                uniforms[mask] = draws[positions[mask] - block * self.chunk_size]
+            # sorted queries walk the cdf in order, which halves the cache misses
+            uniforms, sort_order = uniforms.mul_(total).sort()
+            indices = torch.empty(len(positions), dtype=torch.int64)
+            indices[sort_order] = torch.searchsorted(self.cdf, uniforms, right=True)
+            return indices.clamp_(max=len(self.cdf) - 1)
+
+        return order
@@ -0,0 +1,20 @@
+__all__ = ['worker_index_stream']
+
+
+def worker_index_stream(sampler, batch_size, num_workers, worker_id, drop_last=False):
+    # DataLoader dispatches batches to its workers round-robin, so a worker can
+    # replay the sampler on its own (forked) copy and keep only its batches
+    batch = []
+    batch_index = 0
+    for index in sampler:
+        batch.append(index)
+        if len(batch) == batch_size:
+            if num_workers == 0 or batch_index % num_workers == worker_id:
+                for index in batch:
+                    yield index
+            batch = []
+            batch_index += 1
+    if batch and not drop_last:
+        if num_workers == 0 or batch_index % num_workers == worker_id:
+            for index in batch:
+                yield index
@@ -0,0 +1,99 @@
+__all__ = ['SCAN_DTYPE', 'SCAN_PENDING', 'SCAN_OK', 'SCAN_UNREADABLE', 'SCAN_UNDECODABLE',
+           'IMAGE_MODES', 'scan_imglist', 'load_scan']
+
+
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from PIL import Image, ImageFile
+from .datasets.base_dataset import open_buffer
+from .datasets.imglist import parse_imglist
+
+
+# one packed record per imglist entry, 18 bytes each
+SCAN_DTYPE = np.dtype([
+    ('status', 'u1'),
+    ('mode', 'u1'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('size', '<u8'),
+])
+SCAN_PENDING, SCAN_OK, SCAN_UNREADABLE, SCAN_UNDECODABLE = 0, 1, 2, 3
+
+# mode code is the index in this tuple plus one, 0 for anything else
+IMAGE_MODES = ('1', 'L', 'P', 'RGB', 'RGBA', 'CMYK', 'YCbCr', 'LAB', 'HSV',
+               'I', 'F', 'LA', 'PA', 'RGBX', 'RGBa', 'La', 'I;16')
+
+
+def _init_worker(reader):
+    global _reader
+    _reader = reader
+    # datasets set this to tolerate truncated files, which is exactly what we look for
+    ImageFile.LOAD_TRUNCATED_IMAGES = False
+
+
+def _scan_chunk(args):
+    indices, paths = args
+    records = np.zeros(len(indices), dtype=SCAN_DTYPE)
+    for record_index, path in enumerate(paths):
+        record = records[record_index]
+        try:
+            content = _reader(path)
+            if content is None:
+                raise FileNotFoundError(path)
+        except Exception:
+            record['status'] = SCAN_UNREADABLE
+            continue
+        record['size'] = len(content)
+        try:
+            image = Image.open(open_buffer(content))
+            image.load()
+        except Exception:
+            record['status'] = SCAN_UNDECODABLE
+            continue
+        record['status'] = SCAN_OK
+        record['mode'] = IMAGE_MODES.index(image.mode) + 1 if image.mode in IMAGE_MODES else 0
+        record['width'], record['height'] = image.size
+    return indices, records
+
+
+def load_scan(fpath):
+    return np.load(fpath, mmap_mode='r')
+
+
+def scan_imglist(imglist, root, reader, out, num_workers=None, chunk_size=256,
+                 report_interval=10, imglist_workers=1, imglist_cache=None):
+    imglist = parse_imglist(imglist, multi_label=True, num_workers=imglist_workers, cache_dir=imglist_cache)
+    num_items = len(imglist)
+
+    # the sidecar is also the progress file: pending records are rescanned on resume
+    if os.path.isfile(out):
+        records = np.load(out, mmap_mode='r+')
+        if records.dtype != SCAN_DTYPE or len(records) != num_items:
+            raise ValueError('{} does not match the imglist ({} records of {}, expect {} of {})'.format(
+                out, len(records), records.dtype, num_items, SCAN_DTYPE))
+    else:
+        records = np.lib.format.open_memmap(out, mode='w+', dtype=SCAN_DTYPE, shape=(num_items,))
+    pending = np.flatnonzero(records['status'] == SCAN_PENDING)
+
+    def chunks():
+        for start in range(0, len(pending), chunk_size):
+            indices = pending[start : start + chunk_size]
+            yield indices, [os.path.join(root, imglist.name(index)) for index in indices]
+
+    start_time = last_report = time.time()
+    num_scanned = num_broken = 0
+    with Pool(num_workers, initializer=_init_worker, initargs=(reader,)) as pool:
+        for indices, chunk_records in pool.imap_unordered(_scan_chunk, chunks()):
+            records[indices] = chunk_records
+            num_scanned += len(indices)
+            num_broken += int(np.count_nonzero(chunk_records['status'] != SCAN_OK))
+            if time.time() - last_report >= report_interval:
+                records.flush()
+                last_report = time.time()
+                print('scanned {}/{} ({:.1f} img/s), {} broken'.format(
+                    num_items - len(pending) + num_scanned, num_items,
+                    num_scanned / (last_report - start_time), num_broken), flush=True)
+    records.flush()
+    return records, num_scanned, time.time() - start_time
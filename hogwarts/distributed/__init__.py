@@ -1 +1,3 @@
 from .misc import *
+from .eval_collector import *
+from .work_queue import *
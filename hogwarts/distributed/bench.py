@@ -0,0 +1,135 @@
+__all__ = ['run_local', 'bench_all_reduce', 'bench_all_gather']
+
+import os
+import json
+import math
+import ctypes
+import time
+import pickle
+import socket
+import argparse
+import statistics
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as multiprocessing
+from .misc import barrier, all_reduce_sum, all_gather_cat, dist_segment
+
+
+def _entry(rank, world_size, port, fn, args, queue):
+    os.environ['OMPI_COMM_WORLD_SIZE'] = str(world_size)
+    os.environ['OMPI_COMM_WORLD_RANK'] = str(rank)
+    dist.init_process_group('gloo', init_method='tcp://127.0.0.1:{}'.format(port),
+                            rank=rank, world_size=world_size)
+    try:
+        result = fn(*args)
+        if rank == 0:
+            # plain pickle, as tensors shared through the queue die with this process
+            queue.put(pickle.dumps(result))
+    finally:
+        dist.destroy_process_group()
+
+
+def run_local(fn, world_size=4, args=()):
+    # runs fn(*args) in every process of a local gloo group, returns what rank 0 returned
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    queue = multiprocessing.get_context('spawn').SimpleQueue()
+    multiprocessing.spawn(_entry, args=(world_size, port, fn, args, queue), nprocs=world_size)
+    return pickle.loads(queue.get())
+
+
+def _time_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        barrier()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e3
+
+
+def _vm_bytes(key):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1]) << 10
+
+
+def _peak_rss(fn):
+    # how far this process's resident memory rose above where it started
+    # during fn; writing 5 to clear_refs resets the high-water mark (Linux).
+    # A fixed mmap threshold keeps glibc from serving large tensors out of
+    # heap that earlier runs freed but kept resident
+    ctypes.CDLL(None).mallopt(-3, 1 << 20)  # M_MMAP_THRESHOLD
+    barrier()
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    start = _vm_bytes('VmRSS')
+    fn()
+    return _vm_bytes('VmHWM') - start
+
+
+def bench_all_reduce(num_tensors=64, numel=256, repeat=20):
+    tensors = [torch.rand(numel) for _ in range(num_tensors)]
+
+    def per_tensor():
+        for tensor in tensors:
+            dist.all_reduce(tensor)
+
+    per_tensor_ms = _time_ms(per_tensor, repeat)
+    coalesced_ms = _time_ms(lambda: all_reduce_sum(tensors), repeat)
+    async_ms = _time_ms(lambda: all_reduce_sum(tensors, async_op=True).wait(), repeat)
+    return {
+        'world_size': dist.get_world_size(),
+        'num_tensors': num_tensors,
+        'numel': numel,
+        'per_tensor_ms': per_tensor_ms,
+        'coalesced_ms': coalesced_ms,
+        'coalesced_async_ms': async_ms,
+    }
+
+
+def bench_all_gather(num_rows=100000, num_cols=1000, repeat=5):
+    # eval outputs split by dist_segment, so the last rank may hold fewer rows
+    world_size = dist.get_world_size()
+    offset, part_size = dist_segment(num_rows)
+    outputs = torch.rand(part_size, num_cols)
+
+    def padded():
+        # what callers did before: pad to the largest part, gather, cat, trim
+        max_size = int(math.ceil(num_rows / world_size))
+        padded_outputs = outputs.new_zeros(max_size, num_cols)
+        padded_outputs[:part_size] = outputs
+        gather_list = [outputs.new_empty(max_size, num_cols) for _ in range(world_size)]
+        dist.all_gather(gather_list, padded_outputs)
+        return torch.cat(gather_list)[:num_rows]
+
+    return {
+        'world_size': world_size,
+        'num_rows': num_rows,
+        'num_cols': num_cols,
+        'padded_ms': _time_ms(padded, repeat),
+        'uneven_ms': _time_ms(lambda: all_gather_cat([outputs]), repeat),
+        # measured on rank 0, in bytes
+        'padded_peak_rss': _peak_rss(padded),
+        'uneven_peak_rss': _peak_rss(lambda: all_gather_cat([outputs])),
+        'output_bytes': num_rows * num_cols * outputs.element_size(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('collective', choices=['all_reduce', 'all_gather'])
+    parser.add_argument('--world-size', '-n', type=int, default=4)
+    parser.add_argument('--num-tensors', type=int, default=64)
+    parser.add_argument('--numel', type=int, default=256)
+    parser.add_argument('--num-rows', type=int, default=100000)
+    parser.add_argument('--num-cols', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    opt = parser.parse_args()
+    if opt.collective == 'all_reduce':
+        result = run_local(bench_all_reduce, opt.world_size, (opt.num_tensors, opt.numel, opt.repeat))
+    else:
+        result = run_local(bench_all_gather, opt.world_size, (opt.num_rows, opt.num_cols, opt.repeat))
+    print(json.dumps(result, indent=2), flush=True)
@@ -0,0 +1,122 @@
+__all__ = ['EvalCollector', 'load_eval_shards']
+
+import os
+import numpy as np
+import torch
+import torch.distributed as dist
+from .misc import get_world_size, get_rank
+
+
+class EvalCollector:
+    # collects per-sample eval outputs in chunks of flush_every batches: pseudo
+    # samples are dropped right away, and each chunk either goes to rank 0,
+    # where consumer(chunk) sees every dataset index exactly once, or is saved
+    # by its rank under out_dir; memory stays at one chunk either way. Every
+    # rank must call add the same number of times (as DistributedSampler
+    # guarantees) and then finish
+
+    def __init__(self, dataset_size, consumer=None, out_dir=None, flush_every=32):
+        if (consumer is None) == (out_dir is None):
+            raise ValueError('exactly one of consumer and out_dir should be given')
+        self.dataset_size = dataset_size
+        self.consumer = consumer
+        self.out_dir = out_dir
+        self.flush_every = flush_every
+        self.world_size = get_world_size()
+        self.rank = get_rank()
+        if out_dir is not None:
+            os.makedirs(out_dir, exist_ok=True)
+        if dist.is_initialized() and dist.get_backend() == 'nccl':
+            self.device = torch.device('cuda', torch.cuda.current_device())
+        else:
+            self.device = torch.device('cpu')
+
+        self.buffer = []
+        self.num_batches = 0
+        self.num_chunks = 0
+        # only rank 0 of a gathering collector tracks which indices it has seen
+        self.seen = np.zeros(dataset_size, dtype=bool) if consumer is not None and self.rank == 0 else None
+
+    def add(self, index, pseudo, **outputs):
+        # index and pseudo are batch['index'] and batch['pseudo'] as made by
+        # BaseDataset, outputs are tensors with one row per sample
+        keep = torch.as_tensor(pseudo).cpu() == 0
+        chunk = {'index': torch.as_tensor(index).cpu()[keep]}
+        for key, value in outputs.items():
+            chunk[key] = value.detach()[keep.to(value.device)].cpu()
+        self.buffer.append(chunk)
+        self.num_batches += 1
+        if self.num_batches % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            chunk = {key: torch.cat([part[key] for part in self.buffer]) for key in self.buffer[0]}
+        else:
+            chunk = None
+        self.buffer = []
+        if self.out_dir is not None:
+            if chunk is not None:
+                fpath = os.path.join(self.out_dir, 'rank{:05d}-chunk{:06d}.pt'.format(self.rank, self.num_chunks))
+                torch.save(chunk, fpath)
+                self.num_chunks += 1
+            return
+        chunk = self._gather(chunk)
+        if self.rank == 0 and chunk is not None:
+            chunk = _drop_seen(chunk, self.seen)
+            if len(chunk['index']):
+                self.consumer(chunk)
+            self.num_chunks += 1
+
+    def _gather(self, chunk):
+        # ranks hold different numbers of rows: exchange counts, pad to the
+        # largest, gather to rank 0 and trim there
+        if self.world_size == 1:
+            return chunk
+        num_rows = 0 if chunk is None else len(chunk['index'])
+        counts = torch.zeros(self.world_size, 1, dtype=torch.int64, device=self.device)
+        dist.all_gather(list(counts.unbind(0)), torch.tensor([num_rows], device=self.device))
+        counts = counts.view(-1).tolist()
+        max_rows = max(counts)
+        if max_rows == 0:
+            return None
+        if chunk is None:
+            raise RuntimeError('rank {} has no outputs to gather but other ranks have'.format(self.rank))
+        gathered = {}
+        for key, value in chunk.items():
+            padded = value.new_zeros((max_rows,) + value.size()[1:], device=self.device)
+            padded[:num_rows] = value
+            gather_list = [torch.empty_like(padded) for _ in range(self.world_size)] if self.rank == 0 else None
+            dist.gather(padded, gather_list, dst=0)
+            if self.rank == 0:
+                gathered[key] = torch.cat([part[:count] for part, count in zip(gather_list, counts)]).cpu()
+        return gathered if self.rank == 0 else None
+
+    def finish(self):
+        # returns on rank 0 of a gathering collector how many indices were
+        # never seen, which is 0 for a complete evaluation
+        self.flush()
+        if self.seen is not None:
+            return int(self.dataset_size - self.seen.sum())
+
+
+def _drop_seen(chunk, seen):
+    # keeps the first row of every index not seen before; padding without
+    # pseudo_index repeats real samples, which must count once
+    index = chunk['index'].numpy()
+    _, first = np.unique(index, return_index=True)
+    first = np.sort(first[~seen[index[first]]])
+    seen[index[first]] = True
+    first = torch.from_numpy(first)
+    return {key: value[first] for key, value in chunk.items()}
+
+
+def load_eval_shards(out_dir, dataset_size):
+    # yields the chunks an out_dir collector saved, each index once
+    seen = np.zeros(dataset_size, dtype=bool)
+    for fname in sorted(os.listdir(out_dir)):
+        if not fname.endswith('.pt'):
+            continue
+        chunk = _drop_seen(torch.load(os.path.join(out_dir, fname)), seen)
+        if len(chunk['index']):
+            yield chunk
@@ -1,12 +1,14 @@
 __all__ = ['get_world_size', 'get_rank', 'get_backend', 'barrier', 'all_reduce_sum',
            'all_reduce_max', 'all_reduce_min', 'broadcast', 'all_gather_cat', 'dist_segment',
-           'dist_init', 'get_host_ip']
+           'dist_init', 'get_host_ip', 'BUCKET_SIZE', 'CoalescedWork']
 
 import os
 import math
 import torch
 import torch.distributed as dist
 import torch.multiprocessing as multiprocessing
+from collections import OrderedDict
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 
 
 def _check_tensor_list(tensor_list):
@@ -42,41 +44,103 @@ def barrier():
     _ = sync_tensor.item()
 
 
-def all_reduce_sum(tensor_list):
-    _check_tensor_list(tensor_list)
-    for tensor in tensor_list:
-        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+# tensors are reduced in flat buckets of up to this many bytes, one collective each
+BUCKET_SIZE = 25 << 20
 
 
-def all_reduce_max(tensor_list):
-    _check_tensor_list(tensor_list)
-    for tensor in tensor_list:
-        dist.all_reduce(tensor, op=dist.ReduceOp.MAX)
+class CoalescedWork:
 
+    def __init__(self, pending):
+        self.pending = pending
 
-def all_reduce_min(tensor_list):
-    _check_tensor_list(tensor_list)
+    def wait(self):
+        # copies the results back into the tensors of each bucket
+        for work, bucket, flat in self.pending:
+            if work is not None:
+                work.wait()
+            if flat is not bucket[0]:
+                for tensor, synced in zip(bucket, _unflatten_dense_tensors(flat, bucket)):
+                    tensor.copy_(synced)
+        self.pending = []
+
+
+def _bucket_tensors(tensor_list, bucket_size):
+    # tensors of one dtype and device, in order, up to bucket_size bytes per bucket
+    groups, sizes = OrderedDict(), {}
     for tensor in tensor_list:
-        tensor.neg_()
-        dist.all_reduce(tensor, op=dist.ReduceOp.MAX)
-        tensor.neg_()
+        key = (tensor.device, tensor.dtype)
+        nbytes = tensor.numel() * tensor.element_size()
+        if key not in groups or sizes[key] + nbytes > bucket_size:
+            groups.setdefault(key, []).append([])
+            sizes[key] = 0
+        groups[key][-1].append(tensor)
+        sizes[key] += nbytes
+    return [bucket for buckets in groups.values() for bucket in buckets]
 
 
-def broadcast(tensor_list, src):
+def _coalesced(collective, tensor_list, bucket_size, async_op):
     _check_tensor_list(tensor_list)
-    for tensor in tensor_list:
-        dist.broadcast(tensor, src)
+    pending = []
+    for bucket in _bucket_tensors(tensor_list, bucket_size):
+        if len(bucket) == 1 and bucket[0].is_contiguous():
+            flat = bucket[0]
+        else:
+            flat = _flatten_dense_tensors(bucket)
+        pending.append((collective(flat, async_op), bucket, flat))
+    work = CoalescedWork(pending)
+    if async_op:
+        return work
+    work.wait()
+
+
+def all_reduce_sum(tensor_list, bucket_size=BUCKET_SIZE, async_op=False):
+    return _coalesced(lambda flat, async_op: dist.all_reduce(flat, op=dist.ReduceOp.SUM, async_op=async_op),
+                      tensor_list, bucket_size, async_op)
+
+
+def all_reduce_max(tensor_list, bucket_size=BUCKET_SIZE, async_op=False):
+    return _coalesced(lambda flat, async_op: dist.all_reduce(flat, op=dist.ReduceOp.MAX, async_op=async_op),
+                      tensor_list, bucket_size, async_op)
+
+
+def all_reduce_min(tensor_list, bucket_size=BUCKET_SIZE, async_op=False):
+    return _coalesced(lambda flat, async_op: dist.all_reduce(flat, op=dist.ReduceOp.MIN, async_op=async_op),
+                      tensor_list, bucket_size, async_op)
+
+
+def broadcast(tensor_list, src, bucket_size=BUCKET_SIZE, async_op=False):
+    return _coalesced(lambda flat, async_op: dist.broadcast(flat, src, async_op=async_op),
+                      tensor_list, bucket_size, async_op)
 
 
 def all_gather_cat(tensor_list, dim=0):
+    # sizes along dim may differ between ranks (e.g. the last part of a
+    # dist_segment); they are exchanged once for all tensors, then every rank
+    # broadcasts its parts straight into one preallocated output per tensor
     _check_tensor_list(tensor_list)
-    world_size = get_world_size()
-    result_list = []
-    for tensor in tensor_list:
-        gather_list = [tensor.new(tensor.size()) for _ in range(world_size)]
-        dist.all_gather(gather_list, tensor)
-        result_list.append(torch.cat(gather_list, dim=dim))
-    return result_list
+    if len(tensor_list) == 0:
+        return []
+    world_size, rank = get_world_size(), get_rank()
+    tensor_list = [tensor.movedim(dim, 0).contiguous() for tensor in tensor_list]
+    local_sizes = torch.LongTensor([len(tensor) for tensor in tensor_list]).to(tensor_list[0].device)
+    sizes = local_sizes.new_empty(world_size, len(tensor_list))
+    dist.all_gather(list(sizes.unbind(0)), local_sizes)
+    offsets = (sizes.cumsum(0) - sizes).tolist()
+    sizes = sizes.tolist()
+
+    result_list, works = [], []
+    for index, tensor in enumerate(tensor_list):
+        total = sum(rank_sizes[index] for rank_sizes in sizes)
+        result = tensor.new_empty((total,) + tensor.size()[1:])
+        result[offsets[rank][index] : offsets[rank][index] + len(tensor)].copy_(tensor)
+        for src in range(world_size):
+            part = result[offsets[src][index] : offsets[src][index] + sizes[src][index]]
+            works.append(dist.broadcast(part, src, async_op=True))
+        result_list.append(result)
+    for work in works:
+        work.wait()
+    # copied back into dim's layout only once every part has arrived
+    return [result.movedim(0, dim).contiguous() for result in result_list]
 
 
 def dist_segment(full_size, world_size=None, rank=None):
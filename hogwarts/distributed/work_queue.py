@@ -0,0 +1,74 @@
+__all__ = ['WorkQueue', 'restore_order']
+
+import json
+import time
+import torch.distributed as dist
+from .misc import get_world_size, get_rank
+
+
+class WorkQueue:
+    # an alternative to dist_segment: ranks pull chunks [start, stop) of
+    # range(size) until none are left, so a slow rank just takes fewer. The
+    # next chunk is an atomic counter in a torch.distributed store, by default
+    # the one behind the process group (or e.g. a TCPStore). Chunk bounds
+    # only depend on size and chunk_size; which rank takes which chunk does
+    # not, so tag results with start and put them back with restore_order.
+    # Store keys are never reset, so every queue of a name takes the next
+    # generation of it, counted per rank: all ranks must create their queues
+    # of a name in the same order, as they would for a collective
+
+    def __init__(self, size, chunk_size=1024, name='work_queue', store=None):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.name = name
+        if store is None:
+            if not dist.is_initialized():
+                raise RuntimeError('WorkQueue needs an initialized process group, or a store')
+            store = dist.distributed_c10d._get_default_store()
+        self.store = store
+        self.world_size = get_world_size()
+        self.rank = get_rank()
+        self.generation = store.add('{}/generation/{}'.format(name, self.rank), 1) - 1
+        self.prefix = '{}/{}'.format(name, self.generation)
+        self.num_chunks = 0
+        self.num_items = 0
+        self.elapsed = 0.
+
+    def __iter__(self):
+        start_time = time.time()
+        try:
+            while True:
+                # add returns the counter after the increment, so every chunk goes out once
+                chunk_index = self.store.add('{}/next'.format(self.prefix), 1) - 1
+                start = chunk_index * self.chunk_size
+                if start >= self.size:
+                    return
+                stop = min(start + self.chunk_size, self.size)
+                self.num_chunks += 1
+                self.num_items += stop - start
+                yield start, stop
+        finally:
+            self.elapsed += time.time() - start_time
+
+    def stats(self):
+        return {
+            'rank': self.rank,
+            'chunks': self.num_chunks,
+            'items': self.num_items,
+            'elapsed': self.elapsed,
+            'items_per_sec': self.num_items / self.elapsed if self.elapsed > 0 else 0.,
+        }
+
+    def gather_stats(self):
+        # every rank calls it; rank 0 gets the stats of all ranks, the others None
+        self.store.set('{}/stats/{}'.format(self.prefix, self.rank), json.dumps(self.stats()))
+        if self.rank != 0:
+            return None
+        keys = ['{}/stats/{}'.format(self.prefix, rank) for rank in range(self.world_size)]
+        self.store.wait(keys)
+        return [json.loads(self.store.get(key)) for key in keys]
+
+
+def restore_order(results):
+    # results: (start, value) pairs from any ranks, in any order
+    return [value for _, value in sorted(results, key=lambda result: result[0])]
@@ -197,9 +197,21 @@ class StatRecord:
         assert not self.empty, 'empty record'
         mean = statistics.mean(self.window)
         var = statistics.variance(self.window, mean)
+        window = sorted(self.window)
         return {
             'mean': mean,
             'var': var,
-            'max': max(self.window),
-            'min': min(self.window)
+            'max': window[-1],
+            'min': window[0],
+            'p50': _percentile(window, 50),
+            'p90': _percentile(window, 90),
+            'p99': _percentile(window, 99),
         }
+
+
+def _percentile(window, q):
+    # linear interpolation between closest ranks of a sorted window, as numpy does
+    pos = (len(window) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(window) - 1)
+    return window[lower] + (window[upper] - window[lower]) * (pos - lower)
@@ -9,6 +9,7 @@ setup(
     install_requires=[
         'pyyaml',
         'torch',
+        'numpy',
         'json5',
         'tensorboard',
     ],
@@ -17,6 +18,9 @@ setup(
             'hcontrol = hogwarts.command:control',
             'hrun = hogwarts.command:run',
             'hls = hogwarts.command:ls',
+            'hpack = hogwarts.command:pack',
+            'hscan = hogwarts.command:scan',
+            'hbench = hogwarts.command:bench',
         ],
     },
 )